@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Benchmark of the fast master playlist reader (hlstools.master) against m3u8.
+
+Measures the parse time of a master playlist with each, and the time it takes
+a fresh interpreter to import each of them.
+
+    $ python benchmarks/bench_master_parser.py
+    $ python benchmarks/bench_master_parser.py --variants 40 --number 5000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import timeit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Compare the fast master playlist reader against m3u8')
+
+    parser.add_argument('-n', '--number',
+                        action='store',
+                        type=int,
+                        default=2000,
+                        help='Number of parses to time (default: 2000)')
+
+    parser.add_argument('--variants',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Generate a master playlist with this many variants instead of using test_server/missing.m3u8')
+
+    parser.add_argument('--imports',
+                        action='store',
+                        type=int,
+                        default=10,
+                        help='Number of interpreter starts to time for the imports (default: 10)')
+
+    return parser.parse_args()
+# enddef get_args()
+
+def generate_master(variants):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:4']
+    for idx in range(variants):
+        lines.append('#EXT-X-STREAM-INF:PROGRAM-ID=1,BANDWIDTH=%d,AVERAGE-BANDWIDTH=%d,RESOLUTION=%dx%d,CODECS="mp4a.40.2, avc1.4d401f"'
+                     % (200000 * (idx + 1), 180000 * (idx + 1), 16 * (idx + 1), 9 * (idx + 1)))
+        lines.append('gear%d/prog_index.m3u8' % idx)
+
+    return '\n'.join(lines) + '\n'
+# enddef generate_master()
+
+# Best of 3 runs of interpreter start-up plus the import, averaged over `number` starts
+def time_import(statement, number):
+    command = [sys.executable, '-c', statement]
+    timer = timeit.Timer(lambda: subprocess.check_call(command, cwd=ROOT_DIR))
+    return min(timer.repeat(3, number)) / number
+# enddef time_import()
+
+def main():
+    args = get_args()
+
+    if args.variants > 0:
+        content = generate_master(args.variants)
+    else:
+        with open(os.path.join(ROOT_DIR, 'test_server', 'missing.m3u8')) as master_file:
+            content = master_file.read()
+
+    import m3u8
+    from hlstools.master import parse_master
+    from hlstools.playlist import summarize
+
+    if summarize(m3u8.M3U8(content, base_uri='http://localhost/')) != parse_master(content, 'http://localhost/'):
+        print >> sys.stderr, "Error: the two parsers don't agree on this playlist"
+        exit(2)
+
+    m3u8_time = min(timeit.repeat(lambda: m3u8.M3U8(content, base_uri='http://localhost/'), repeat=3, number=args.number)) / args.number
+    fast_time = min(timeit.repeat(lambda: parse_master(content, 'http://localhost/'), repeat=3, number=args.number)) / args.number
+
+    base_import = time_import('pass', args.imports)
+    m3u8_import = time_import('import m3u8', args.imports) - base_import
+    fast_import = time_import('import hlstools.master', args.imports) - base_import
+
+    print "Master playlist: %d variants, %d bytes" % (content.count('#EXT-X-STREAM-INF'), len(content))
+    print "%-24s %14s %14s" % ("", "m3u8", "hlstools.master")
+    print "%-24s %12.1fus %12.1fus   (%.1fx)" % ("parse time", m3u8_time * 1e6, fast_time * 1e6, m3u8_time / fast_time)
+    print "%-24s %12.1fms %12.1fms" % ("import time", m3u8_import * 1e3, fast_import * 1e3)
+
+    return 0
+# enddef main()
+
+# Start program
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+"""
+Benchmark of the scripts against the synthetic test server.
+
+Starts test_server/synthetic_server.py in the background, then runs each
+script over a list of URLs for every scenario. It reports the URLs checked
+per second, the time to the first result (interpreter start-up included), the
+50th/99th percentile time per URL and the peak memory (RSS) of the script.
+The "validate" script is the availability check with --probe validate, for
+comparing the memory of the streaming validator with the full download.
+
+The time per URL is the gap between two lines of output after the first one,
+which is exact with the default single job. With --jobs the results come out in bursts, so only
+the URLs/sec figure is meaningful.
+
+Results can be saved with --save and compared with a later run with
+--baseline, which exits with 1 when a figure got worse by more than
+--tolerance percent:
+
+    $ python benchmarks/bench_scripts.py --save before.json
+    $ python benchmarks/bench_scripts.py --baseline before.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'test_server'))
+
+from synthetic_server import get_bandwidth, start_server
+
+# (name, synthetic server options, number of variants)
+SCENARIOS = [
+    ('vod', 'variants=5', 5),
+    ('wide', 'variants=40', 40),
+    ('long', 'variants=3,segments=100000', 3),
+    # 6 hours of 2s segments, as in a DVR window
+    ('dvr', 'variants=8,segments=10800,duration=2', 8),
+    ('live', 'variants=5,live=1', 5),
+    ('faulty', 'variants=5,latency=20,jitter=20,error=0.05', 5),
+    # Audio and subtitle renditions and I-frame playlists, checked with the variants
+    ('renditions', 'variants=5,audio=3,subtitles=2,iframes=1', 5),
+]
+
+SCRIPTS = ['availability', 'validate', 'bandwidths', 'profiles']
+
+# Figures where a lower value is better, checked against the --baseline
+COMPARED_FIGURES = ('first_ms', 'p99_ms', 'peak_rss_mb')
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Measure the throughput, latency and memory of the scripts against a synthetic HLS server')
+
+    parser.add_argument('-n', '--urls',
+                        action='store',
+                        type=int,
+                        default=50,
+                        help='Number of URLs per run (default: 50)')
+
+    parser.add_argument('-j', '--jobs',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='--jobs passed to the scripts (default: 1)')
+
+    parser.add_argument('-s', '--scenarios',
+                        action='store',
+                        default=','.join(name for name, _, _ in SCENARIOS),
+                        help='Comma separated scenarios to run (default: all of %s)' % ', '.join(name for name, _, _ in SCENARIOS))
+
+    parser.add_argument('--scripts',
+                        action='store',
+                        default=','.join(SCRIPTS),
+                        help='Comma separated scripts to run (default: %s)' % ', '.join(SCRIPTS))
+
+    parser.add_argument('--save',
+                        action='store',
+                        metavar='FILE',
+                        help='Save the results as JSON')
+
+    parser.add_argument('--baseline',
+                        action='store',
+                        metavar='FILE',
+                        help='Compare the results with ones saved by an earlier --save')
+
+    parser.add_argument('--tolerance',
+                        action='store',
+                        type=float,
+                        default=20.0,
+                        help='Percentage a figure may get worse than the --baseline before it is reported as a regression (default: 20)')
+
+    return parser.parse_args()
+# enddef get_args()
+
+def get_command(script, variants, url_filename, jobs):
+    if script == 'availability':
+        command = ['check-stream-availability.py']
+    elif script == 'validate':
+        command = ['check-stream-availability.py', '--probe', 'validate']
+    elif script == 'bandwidths':
+        command = ['check-stream-bandwidths.py', '-b', ' '.join(str(get_bandwidth(idx)) for idx in range(variants))]
+    else:
+        command = ['list-stream-profiles.py']
+
+    return [sys.executable] + command + ['-j', str(jobs), '-f', url_filename]
+# enddef get_command()
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+# enddef percentile()
+
+# Runs a script and returns its figures. Every line of output (stdout and stderr) is the result of one URL.
+def run_script(command):
+    start = time.time()
+    proc = subprocess.Popen(command, cwd=ROOT_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    gaps = []
+    last = start
+    for line in iter(proc.stdout.readline, ''):
+        now = time.time()
+        gaps.append(now - last)
+        last = now
+    elapsed = time.time() - start
+
+    # wait4() is the only way to get the peak RSS of this one child, ru_maxrss is in KB on Linux
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+
+    return {
+        'urls_per_sec': len(gaps) / elapsed if elapsed else 0.0,
+        'first_ms': gaps[0] * 1000 if gaps else 0.0,
+        'p50_ms': percentile(gaps[1:], 0.5) * 1000,
+        'p99_ms': percentile(gaps[1:], 0.99) * 1000,
+        'peak_rss_mb': rusage.ru_maxrss / 1024.0,
+        'return_code': proc.returncode,
+        'lines': len(gaps),
+    }
+# enddef run_script()
+
+# Returns the descriptions of the figures that got worse than the baseline by more than tolerance percent
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for key, figures in sorted(results.items()):
+        if key not in baseline:
+            continue
+        before = baseline[key]
+        factor = 1 + tolerance / 100.0
+
+        if figures['urls_per_sec'] * factor < before['urls_per_sec']:
+            regressions.append('%s urls/sec %.1f -> %.1f' % (key, before['urls_per_sec'], figures['urls_per_sec']))
+        for figure in COMPARED_FIGURES:
+            if figures[figure] > before[figure] * factor:
+                regressions.append('%s %s %.1f -> %.1f' % (key, figure, before[figure], figures[figure]))
+
+    return regressions
+# enddef find_regressions()
+
+def main():
+    args = get_args()
+
+    scenarios = [scenario for scenario in SCENARIOS if scenario[0] in args.scenarios.split(',')]
+    scripts = [script for script in SCRIPTS if script in args.scripts.split(',')]
+
+    server = start_server()
+    base_url = 'http://%s:%d' % server.server_address
+
+    print "%-10s %-13s %6s %10s %10s %10s %10s %10s %4s" % ("scenario", "script", "urls", "urls/sec", "first ms", "p50 ms", "p99 ms", "peak MB", "rc")
+
+    results = {}
+    for name, options, variants in scenarios:
+        # Distinct URLs down to the variants, so nothing can be reused between them on the client side
+        url_file = tempfile.NamedTemporaryFile(suffix='.urls', delete=False)
+        try:
+            for idx in range(args.urls):
+                url_file.write('%s/%s,id=%d/master.m3u8\n' % (base_url, options, idx))
+            url_file.close()
+
+            for script in scripts:
+                figures = run_script(get_command(script, variants, url_file.name, args.jobs))
+                results['%s/%s' % (name, script)] = figures
+                print "%-10s %-13s %6d %10.1f %10.1f %10.1f %10.1f %10.1f %4d" % (name, script, figures['lines'], figures['urls_per_sec'],
+                                                                                   figures['first_ms'], figures['p50_ms'], figures['p99_ms'],
+                                                                                   figures['peak_rss_mb'], figures['return_code'])
+                sys.stdout.flush()
+        finally:
+            os.remove(url_file.name)
+
+    server.shutdown()
+
+    if args.save:
+        with open(args.save, 'w') as save_file:
+            json.dump(results, save_file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print "Regression:", regression
+        if regressions:
+            exit(1)
+
+    return 0
+# enddef main()
+
+# Start program
+if __name__ == "__main__":
+    main()
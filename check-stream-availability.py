@@ -6,122 +6,31 @@
 # 3 or more: unknown
 
 import argparse
-import getpass
-import atexit
 import sys
-import time
-from urlparse import urlparse
+from functools import partial
 
-import m3u8
+from hlstools import availability, mediastats, watch
+from hlstools.common import add_common_arguments, check_common_arguments, iter_urls, render_date_iso8601, run_urls, setup_session, write_check_result
 
 def get_args():
     """Get command line args from the user.
     """
     parser = argparse.ArgumentParser(
-        description='Check profile bitrates match provided list')
-
-    parser.add_argument('-f', '--file',
-                        action='store',
-                        help='File of URLs to load. This overrides a URL provided on the command-line')
-
-    parser.add_argument('-v', '--verbose',
-                        action='store_true',
-                        default=False,
-                        help='Display verbose output')
-
-    parser.add_argument('-t', '--timestamp',
-                        action='store_true',
-                        default=False,
-                        help='Display timestamp in the brief output')
-
-    parser.add_argument('url',
-                        nargs='?', default='NO_URL',
-                        action='store',
-                        help='The url of the m3u8 file')
-
+        description='Check all the stream playlists of a master m3u8 playlist are available')
 
+    add_common_arguments(parser)
+    availability.add_arguments(parser)
+    mediastats.add_arguments(parser)
+    watch.add_arguments(parser)
 
     args = parser.parse_args()
-    if args.url == "NO_URL" and not args.file:
-        print >> sys.stderr, "Error: You must either specify a URL on the command-line or provide a filename via the --file argument\n\n"
-        parser.print_help()
-        exit(2)
+    check_common_arguments(parser, args, 2)
+    availability.check_arguments(parser, args)
+    watch.check_arguments(parser, args)
 
     return args
 # enddef get_args()
 
-def get_urls(args):
-    lines = []
-    if args.file:
-        lines = [line.strip() for line in open(args.file)]
-    else:
-        lines.append(args.url)
-
-    return lines
-# enddef get_urls()
-
-def verify_url(url):
-    urlcheck = urlparse(url)
-
-    if len(urlcheck.scheme) < 1 or len(urlcheck.netloc) < 1 or len(urlcheck.path) < 1:
-        return False
-
-    return True
-# enddef verify_url()
-
-def render_date_iso8601():
-    timestamp = time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime())
-    return timestamp
-# enddef render_date_iso8601()
-
-def print_brief(timestamp, out_stream, *items):
-    output = ' '.join(map(str, items))
-    if timestamp:
-        print >> out_stream, render_date_iso8601(), output
-    else:
-        print >> out_stream, output
-# endef print_brief()
-
-# This function sets the return code only if the new code is worse
-def set_return_code(return_code, new_code):
-    return new_code if return_code < new_code else return_code
-# enddef set_return_code
-
-def check_streams(variant_streams, base_uri, verbose):
-    result_msg = "BaseURI="
-    result_msg += base_uri
-    result_msg += " >> "
-    result_code = 0
-
-    for stream in variant_streams:
-        result = ""
-        stream_url = ""
-        stream_url = base_uri
-        stream_url += stream.uri
-
-        try:
-            stream_playlist = m3u8.load(stream_url)
-            result = "OK"
-            result_msg += stream.uri
-            result_msg += ":"
-            result_msg += result
-            result_msg += ", "
-        except IOError as error:
-            result =  str(error)
-            result_code = 2
-            result_msg += stream.uri
-            result_msg += ":"
-            result_msg += result
-            result_msg += ", "
-
-        # print stream_url
-        if verbose:
-            print "\t%s: %s" % (stream.uri, result)
-
-    return (result_code, result_msg[:-2])
-
-# enddef check_streams()
-
 def main():
     """
     Simple command-line program for checking the availability of streams within a master m3u8 playlist.
@@ -131,43 +40,16 @@ def main():
     if args.verbose:
         args.timestamp = True
 
-    urls = get_urls(args)
-    result = (0, "OK")
-    result_code = 0
+    if args.watch:
+        setup_session(args)
+        exit(watch.watch_urls(iter_urls(args), args))
+
+    count, result_code = run_urls(partial(availability.check_url, args=args), args, write_check_result)
 
-    if len(urls) < 1:
+    if count < 1:
         print >> sys.stderr, render_date_iso8601(), "No valid URLs to process."
         exit(2)
 
-    for url in urls:
-        if verify_url(url) == True:
-            try:
-                master_playlist = m3u8.load(url)
-                if master_playlist.is_variant:
-                    if args.verbose:
-                        print >> sys.stdout, render_date_iso8601(), "Checking URL:", url
-
-                    result = check_streams(master_playlist.playlists, master_playlist.base_uri, args.verbose)
-                    result_code = set_return_code(result_code, result[0])
-
-                    if not args.verbose:
-                        if result[0] == 0:
-                            print_brief(args.timestamp, sys.stdout, "OK:", result[1])
-                        elif result[0] == 1:
-                            print_brief(args.timestamp, sys.stdout, "WARNING:", result[1])
-                        else:
-                            print_brief(args.timestamp, sys.stdout, "CRITICAL:", result[1])
-
-                else:
-                    print_brief(args.timestamp, sys.stdout, "CRITICAL: URL=", url, ">> Does not contain any streams")
-                    result_code = 2
-            except IOError as error:
-                print_brief(args.timestamp, sys.stdout, "CRITICAL: URL=", url, ">>", error)
-                result_code = 2
-        else:
-            print_brief(args.timestamp, sys.stdout, "CRITICAL: URL=", url, ">> Not a valid URL")
-            result_code = 2
-
     if result_code != 0:
         exit(result_code)
 
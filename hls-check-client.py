@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# Return Codes - Sensu compatible
+# 0: ok
+# 1: warning
+# 2: critical
+# 3 or more: unknown
+
+import argparse
+import sys
+
+from hlstools.client import DEFAULT_PORT, DEFAULT_TIMEOUT, UNKNOWN, DaemonError, run_check
+
+def get_args():
+    """Get command line args from the user.
+    """
+    parser = argparse.ArgumentParser(
+        description='Run an HLS check on hls-check-daemon.py. Takes the same arguments as the availability and bandwidths commands of hls-check.py, and prints the same output with the same return code')
+
+    parser.add_argument('-s', '--socket',
+                        action='store',
+                        help='Unix socket the daemon listens on')
+
+    parser.add_argument('-d', '--daemon',
+                        action='store',
+                        default='127.0.0.1:%d' % DEFAULT_PORT,
+                        help='HOST:PORT the daemon listens on (default: 127.0.0.1:%d)' % DEFAULT_PORT)
+
+    parser.add_argument('--client-timeout',
+                        action='store',
+                        type=float,
+                        default=DEFAULT_TIMEOUT,
+                        help='Seconds to wait for the daemon to answer (default: %d)' % DEFAULT_TIMEOUT)
+
+    parser.add_argument('check',
+                        nargs=argparse.REMAINDER,
+                        help='The check command line, eg. availability -t http://example.com/master.m3u8')
+
+    args = parser.parse_args()
+    if not args.check:
+        print >> sys.stderr, "Error: You must give the check to run, eg. availability http://example.com/master.m3u8\n\n"
+        parser.print_help()
+        exit(UNKNOWN)
+
+    return args
+# enddef get_args()
+
+def main():
+    """
+    Lightweight command-line program asking the check daemon for a check.
+    """
+    args = get_args()
+
+    try:
+        code, stdout, stderr = run_check(args.check, args.daemon, args.socket, args.client_timeout)
+    except DaemonError as error:
+        print >> sys.stderr, "UNKNOWN:", error
+        exit(UNKNOWN)
+
+    sys.stdout.write(stdout.encode('utf-8'))
+    sys.stderr.write(stderr.encode('utf-8'))
+
+    if code != 0:
+        exit(code)
+
+    return 0
+# enddef main()
+
+# Start program
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+
+from hlstools.client import DEFAULT_PORT
+from hlstools.common import add_session_arguments, check_session_arguments, render_date_iso8601, setup_session
+from hlstools.daemon import CheckDaemon, DaemonServer, UnixDaemonServer
+from hlstools.metrics import Metrics
+
+def get_args():
+    """Get command line args from the user.
+    """
+    parser = argparse.ArgumentParser(
+        description='Keep a warm session for the HLS checks and run them for hls-check-client.py, over a local port or a Unix socket')
+
+    parser.add_argument('-s', '--socket',
+                        action='store',
+                        help='Unix socket to listen on, instead of a TCP port')
+
+    parser.add_argument('-b', '--bind',
+                        action='store',
+                        default='127.0.0.1',
+                        help='Address to listen on (default: 127.0.0.1)')
+
+    parser.add_argument('-p', '--port',
+                        action='store',
+                        type=int,
+                        default=DEFAULT_PORT,
+                        help='Port to listen on (default: %d)' % DEFAULT_PORT)
+
+    parser.add_argument('--refresh',
+                        action='store',
+                        type=float,
+                        default=0,
+                        help='Run every check asked for again every this many seconds in the background and answer it from the last result, 0 to run each check when it is asked for (default: 0)')
+
+    parser.add_argument('-v', '--verbose',
+                        action='store_true',
+                        default=False,
+                        help='Log every request')
+
+    add_session_arguments(parser)
+
+    args = parser.parse_args()
+    check_session_arguments(parser, args, 1)
+
+    if args.refresh < 0:
+        print >> sys.stderr, "Error: --refresh can't be negative\n\n"
+        parser.print_help()
+        exit(1)
+
+    return args
+# enddef get_args()
+
+def main():
+    """
+    Command-line program running the check daemon until it's interrupted.
+    """
+    args = get_args()
+
+    # Without a --cache file the playlists are cached in memory for the life of the daemon
+    if not args.cache:
+        args.cache = ':memory:'
+    session = setup_session(args)
+    session.metrics = Metrics()
+
+    daemon = CheckDaemon(session, args.refresh)
+    try:
+        if args.socket:
+            server = UnixDaemonServer(args.socket, daemon, args.verbose)
+            print >> sys.stderr, render_date_iso8601(), "Listening on", args.socket
+        else:
+            server = DaemonServer((args.bind, args.port), daemon, args.verbose)
+            print >> sys.stderr, render_date_iso8601(), "Listening on http://%s:%d/" % server.server_address
+    except (IOError, OSError) as error:
+        print >> sys.stderr, render_date_iso8601(), "Error: starting the daemon >>", error
+        exit(1)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+# enddef main()
+
+# Start program
+if __name__ == "__main__":
+    main()
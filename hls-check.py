@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# Return Codes - Sensu compatible
+# 0: ok
+# 1: warning
+# 2: critical
+# 3 or more: unknown
+
+import argparse
+import sys
+from cStringIO import StringIO
+from functools import partial
+
+from hlstools import availability, bandwidths, mediastats, profiles, shards, watch
+from hlstools.common import add_common_arguments, check_common_arguments, iter_urls, load_master, print_brief, render_date_iso8601, render_status, run_urls, set_return_code, setup_session, write_check_result
+
+def get_args():
+    """Get command line args from the user.
+    """
+    parser = argparse.ArgumentParser(
+        description='Run the HLS checks. The "all" command downloads each master playlist once and runs every check on it')
+
+    subparsers = parser.add_subparsers(dest='command')
+
+    availability_parser = subparsers.add_parser('availability',
+                                                help='Check all the stream playlists of a master m3u8 playlist are available')
+    add_common_arguments(availability_parser)
+    availability.add_arguments(availability_parser)
+    mediastats.add_arguments(availability_parser)
+    watch.add_arguments(availability_parser)
+
+    bandwidths_parser = subparsers.add_parser('bandwidths',
+                                              help='Check profile bitrates match provided list')
+    bandwidths.add_arguments(bandwidths_parser)
+    add_common_arguments(bandwidths_parser)
+
+    profiles_parser = subparsers.add_parser('profiles',
+                                            help='Grab the various stream profile bitrates and resolutions for master m3u8 files')
+    add_common_arguments(profiles_parser, brief=False)
+    profiles.add_arguments(profiles_parser)
+    mediastats.add_arguments(profiles_parser)
+
+    all_parser = subparsers.add_parser('all',
+                                       help='Check availability and bandwidths and list the profiles from a single download of each master playlist')
+    bandwidths.add_arguments(all_parser)
+    add_common_arguments(all_parser)
+    availability.add_arguments(all_parser)
+    profiles.add_arguments(all_parser)
+    mediastats.add_arguments(all_parser)
+
+    merge_parser = subparsers.add_parser('merge',
+                                         help='Combine the results of the shards of a --shard sweep into one brief line')
+    merge_parser.add_argument('--shard-dir',
+                              action='store',
+                              metavar='DIR',
+                              required=True,
+                              help='Directory the shards wrote their results to')
+    merge_parser.add_argument('-n', '--shards',
+                              action='store',
+                              type=int,
+                              required=True,
+                              help='Number of shards the URL list was split into')
+    merge_parser.add_argument('--max-age',
+                              action='store',
+                              type=float,
+                              help='Seconds since a shard finished after which its results are too old to use, the shard counts as missing')
+    merge_parser.add_argument('-t', '--timestamp',
+                              action='store_true',
+                              default=False,
+                              help='Display timestamp in the brief output')
+
+    subparser = {'availability': availability_parser, 'bandwidths': bandwidths_parser,
+                 'profiles': profiles_parser, 'all': all_parser}
+
+    args = parser.parse_args()
+    if args.command == 'merge':
+        if args.shards < 1:
+            print >> sys.stderr, "Error: --shards must be at least 1\n\n"
+            merge_parser.print_help()
+            exit(2)
+        return args
+
+    check_common_arguments(subparser[args.command], args, 1 if args.command == 'profiles' else 2)
+    if args.command in ('availability', 'all'):
+        availability.check_arguments(subparser[args.command], args)
+    if args.command == 'availability':
+        watch.check_arguments(subparser[args.command], args)
+    if args.command in ('bandwidths', 'all'):
+        bandwidths.check_arguments(subparser[args.command], args)
+    if args.command in ('profiles', 'all'):
+        profiles.check_arguments(subparser[args.command], args)
+
+    return args
+# enddef get_args()
+
+# Runs all the checks on a single download of the master playlist.
+# Returns the return code, the brief output and the ProfileRecord (or None).
+def check_all_url(url, args, ref_bandwidths):
+    out_stream = StringIO()
+    result_code = 2
+    record = None
+
+    master_playlist = load_master(url, args.timestamp, out_stream)
+    if master_playlist is not None:
+        result_code = availability.check_master(url, master_playlist, args, out_stream)
+        result_code = set_return_code(result_code, bandwidths.check_master(url, master_playlist, args, ref_bandwidths, out_stream))
+        record = profiles.make_record(url, master_playlist, args.media_stats)
+
+    return (result_code, out_stream.getvalue(), record)
+# enddef check_all_url()
+
+def write_all_result(result, writer, history=None):
+    result_code, output, record = result
+
+    sys.stdout.write(output)
+    if record is not None:
+        profiles.write_result((record, None), writer, history)
+
+    return result_code
+# enddef write_all_result()
+
+def main():
+    """
+    Command-line program running the stream checks, either one at a time or all of them in a single pass.
+    """
+    args = get_args()
+
+    if args.command == 'merge':
+        result_code, output = shards.merge_shards(args.shard_dir, args.shards, args.max_age)
+        print_brief(args.timestamp, sys.stdout, render_status(result_code), output)
+        exit(result_code)
+
+    if getattr(args, 'verbose', False):
+        args.timestamp = True
+
+    if getattr(args, 'watch', False):
+        setup_session(args)
+        exit(watch.watch_urls(iter_urls(args), args))
+
+    if args.command in ('profiles', 'all') and args.show_history:
+        count = profiles.show_history(args)
+        exit(0 if count > 0 else 1)
+
+    writer = None
+    history = None
+    if args.command == 'profiles':
+        writer = profiles.open_writer(args)
+        history = profiles.open_history(args)
+        process_url = partial(profiles.list_url, media_stats=args.media_stats)
+        write_result = partial(profiles.write_result, writer=writer, history=history)
+    elif args.command == 'availability':
+        process_url = partial(availability.check_url, args=args)
+        write_result = write_check_result
+    elif args.command == 'bandwidths':
+        process_url = partial(bandwidths.check_url, args=args, ref_bandwidths=args.ref_bandwidths)
+        write_result = write_check_result
+    else:
+        writer = profiles.open_writer(args)
+        history = profiles.open_history(args)
+        process_url = partial(check_all_url, args=args, ref_bandwidths=args.ref_bandwidths)
+        write_result = partial(write_all_result, writer=writer, history=history)
+
+    try:
+        count, result_code = run_urls(process_url, args, write_result)
+    finally:
+        if writer is not None:
+            writer.close()
+        if history is not None:
+            history.close()
+
+    if count < 1:
+        print >> sys.stderr, render_date_iso8601(), "No valid URLs to process."
+        exit(1 if args.command == 'profiles' else 2)
+
+    if args.command != 'profiles' and result_code != 0:
+        exit(result_code)
+
+    return 0
+# enddef main()
+
+# Start program
+if __name__ == "__main__":
+    main()
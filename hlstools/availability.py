@@ -0,0 +1,226 @@
+"""
+Availability check: are all the stream playlists of a master downloadable?
+
+Besides the variant streams, the #EXT-X-MEDIA renditions (audio, video and
+subtitles) and the I-frame playlists are checked too, all through the same
+pool of downloads, and reported in a group per type after the variants.
+"""
+
+import sys
+import urllib2
+from cStringIO import StringIO
+from functools import partial
+from itertools import izip
+from multiprocessing.pool import ThreadPool
+from urlparse import urljoin
+
+from hlstools import fetch, segments
+from hlstools.mediastats import render_stats
+from hlstools.validator import MediaValidator
+from hlstools.common import argument_error, load_master, print_brief, render_date_iso8601, render_status, set_return_code
+from hlstools.playlist import get_rendition_groups, has_header
+
+PROBE_MODES = ('full', 'validate', 'head', 'range')
+
+# Enough of the start of a playlist to find the #EXTM3U header, even after a BOM or blank lines
+PROBE_BYTES = 64
+
+# Responses meaning the server doesn't support the probe, rather than the playlist being unavailable
+PROBE_UNSUPPORTED_CODES = (405, 416, 501)
+
+def add_arguments(parser):
+    parser.add_argument('-c', '--concurrency',
+                        action='store',
+                        type=int,
+                        default=8,
+                        help='Maximum number of stream playlists to download at the same time for each master playlist (default: 8)')
+
+    parser.add_argument('--probe',
+                        action='store',
+                        choices=PROBE_MODES,
+                        default='full',
+                        help='How to check a stream playlist: "full" downloads it and checks the #EXTM3U header (over the --cache with conditional requests), "validate" checks its syntax and segment sequence line by line as it downloads, without keeping it in memory, "head" only sends a HEAD request and "range" downloads the first few bytes to confirm the #EXTM3U header (default: full)')
+
+    parser.add_argument('--probe-fallback',
+                        action='store_true',
+                        default=False,
+                        help="Fall back to a full download when the server doesn't support the HEAD or Range request of --probe")
+
+    parser.add_argument('--variants-only',
+                        action='store_true',
+                        default=False,
+                        help='Only check the variant streams, not the #EXT-X-MEDIA audio, video and subtitle renditions and the I-frame playlists of the master')
+
+    parser.add_argument('--segments',
+                        action='store',
+                        choices=segments.SAMPLE_MODES,
+                        help='Also check the segments of each stream playlist are available, using HEAD requests on the first, last, random or all the segments')
+
+    parser.add_argument('--segment-count',
+                        action='store',
+                        type=int,
+                        default=3,
+                        help='Number of segments to check per stream playlist with --segments first, last or random (default: 3)')
+
+    parser.add_argument('--segment-concurrency',
+                        action='store',
+                        type=int,
+                        default=4,
+                        help='Maximum number of segments to check at the same time for each stream playlist (default: 4)')
+# enddef add_arguments()
+
+def check_arguments(parser, args):
+    if args.concurrency < 1:
+        argument_error(parser, "--concurrency must be at least 1", 2)
+
+    if args.segments and (args.segment_count < 1 or args.segment_concurrency < 1):
+        argument_error(parser, "--segment-count and --segment-concurrency must be at least 1", 2)
+# enddef check_arguments()
+
+# Downloads a stream playlist and reads its header and durations, which is all the check needs, instead of parsing every segment
+def check_stream(stream_url, media_stats=False):
+    try:
+        summary = fetch.get_session().load_media(stream_url)
+    except IOError as error:
+        return (2, str(error))
+
+    if not summary.has_header:
+        return (2, "Missing #EXTM3U header")
+
+    if not media_stats:
+        return (0, "OK")
+
+    stats = summary.stats
+    if stats.target_violations > 0:
+        return (1, render_stats(stats))
+
+    return (0, "OK (%s)" % render_stats(stats))
+# enddef check_stream()
+
+# Checks a stream playlist line by line as it downloads, in bounded memory however long it is
+def validate_stream(stream_url, media_stats=False):
+    try:
+        validator = fetch.get_session().stream(stream_url, MediaValidator).sink
+    except IOError as error:
+        return (2, str(error))
+
+    if validator.problems:
+        return (2, validator.render_problems())
+
+    if not media_stats:
+        return (0, "OK")
+
+    stats = validator.get_stats()
+    if stats.target_violations > 0:
+        return (1, render_stats(stats))
+
+    return (0, "OK (%s)" % render_stats(stats))
+# enddef validate_stream()
+
+# Checks a stream playlist without downloading and parsing the whole of it
+def probe_stream(stream_url, probe, fallback=False):
+    session = fetch.get_session()
+
+    try:
+        if probe == 'head':
+            session.fetch(stream_url, method='HEAD')
+        else:
+            response = session.fetch(stream_url, headers={'Range': 'bytes=0-%d' % (PROBE_BYTES - 1), 'Accept-Encoding': 'identity'},
+                                     max_bytes=PROBE_BYTES)
+            if not has_header(response.body):
+                return (2, "Missing #EXTM3U header")
+
+        return (0, "OK")
+    except urllib2.HTTPError as error:
+        if fallback and error.code in PROBE_UNSUPPORTED_CODES:
+            return check_stream(stream_url)
+        return (2, str(error))
+    except IOError as error:
+        return (2, str(error))
+# enddef probe_stream()
+
+# Returns the function used to check each stream playlist for the command-line options
+def get_stream_check(args):
+    # The segments are listed in the playlist, so this always downloads the whole of it
+    if args.segments:
+        return partial(segments.check_stream_segments, mode=args.segments, count=args.segment_count,
+                       concurrency=args.segment_concurrency)
+
+    if args.probe == 'full':
+        return partial(check_stream, media_stats=args.media_stats)
+
+    if args.probe == 'validate':
+        return partial(validate_stream, media_stats=args.media_stats)
+
+    return partial(probe_stream, probe=args.probe, fallback=args.probe_fallback)
+# enddef get_stream_check()
+
+# rendition_groups are the (type, URIs) of the other playlists of the master, see get_rendition_groups()
+def check_streams(variant_streams, base_uri, verbose, concurrency=1, out_stream=sys.stdout, check_stream=check_stream,
+                  rendition_groups=()):
+    result_msg = "BaseURI="
+    result_msg += base_uri
+    result_msg += " >> "
+    result_code = 0
+
+    # The variants (with no type) then each group, all checked in the same pool so the groups don't wait for each other
+    streams = [(None, stream.uri) for stream in variant_streams]
+    for rendition_type, uris in rendition_groups:
+        streams.extend((rendition_type, uri) for uri in uris)
+    # Rendition and I-frame URIs are often absolute or relative to the host rather than to the master
+    stream_urls = [urljoin(base_uri, uri) for _, uri in streams]
+
+    # The downloads run in parallel but imap() hands the results back in playlist order
+    pool = ThreadPool(max(1, min(concurrency, len(stream_urls))))
+    try:
+        last_type = None
+        for (stream_type, uri), (stream_code, result) in izip(streams, pool.imap(check_stream, stream_urls)):
+            result_code = set_return_code(result_code, stream_code)
+            if stream_type != last_type:
+                result_msg = result_msg[:-2] + " >> %s: " % stream_type
+                last_type = stream_type
+            result_msg += uri
+            result_msg += ":"
+            result_msg += result
+            result_msg += ", "
+
+            if verbose:
+                if stream_type is None:
+                    print >> out_stream, "\t%s: %s" % (uri, result)
+                else:
+                    print >> out_stream, "\t%s %s: %s" % (stream_type, uri, result)
+    finally:
+        pool.close()
+        pool.join()
+
+    return (result_code, result_msg[:-2])
+
+# enddef check_streams()
+
+# Runs the availability check on an already loaded master playlist and prints the result
+def check_master(url, master_playlist, args, out_stream):
+    if args.verbose:
+        print >> out_stream, render_date_iso8601(), "Checking URL:", url
+
+    rendition_groups = get_rendition_groups(master_playlist) if not args.variants_only else ()
+    result = check_streams(master_playlist.playlists, master_playlist.base_uri, args.verbose, args.concurrency, out_stream,
+                           get_stream_check(args), rendition_groups)
+
+    if not args.verbose:
+        print_brief(args.timestamp, out_stream, render_status(result[0]), result[1])
+
+    return result[0]
+# enddef check_master()
+
+# Checks a single master playlist and returns the return code along with the output for it.
+# The output is buffered so parallel jobs don't interleave their lines.
+def check_url(url, args):
+    out_stream = StringIO()
+    result_code = 2
+
+    master_playlist = load_master(url, args.timestamp, out_stream)
+    if master_playlist is not None:
+        result_code = check_master(url, master_playlist, args, out_stream)
+
+    return (result_code, out_stream.getvalue())
+# enddef check_url()
@@ -0,0 +1,384 @@
+"""
+Bandwidth check: does the master playlist have the expected list of bandwidths?
+"""
+
+import sys
+import threading
+from bisect import bisect_left
+from cStringIO import StringIO
+
+from hlstools import bitrate
+from hlstools.common import argument_error, load_master, print_brief, render_status, set_return_code, verify_url
+from hlstools.segments import SAMPLE_MODES
+
+def add_arguments(parser):
+    parser.add_argument('-b', '--bandwidths',
+                        action='store',
+                        help='Quoted list of bandwidths to check profile against. ie. "889000 3767000 741000 4504000 1347000 2531000 2294000 1873000"')
+
+    parser.add_argument('-l', '--ladders',
+                        action='store',
+                        help='JSON file of the expected bandwidths per URL host, shell-style pattern (matching the whole URL) or regex (searched for anywhere in the URL). URLs not matching any entry are checked against --bandwidths')
+
+    parser.add_argument('-p', '--variance-percent',
+                        action='store',
+                        type=float,
+                        help='For dynamically created bandwidths, define a percentage as a float for +/- variance of listed expected bandwidths')
+
+    parser.add_argument('-u', '--unordered',
+                        action='store_true',
+                        default=False,
+                        help="Just validate the bandwidth is defined, don't validate the order")
+
+    parser.add_argument('--measure',
+                        action='store',
+                        choices=SAMPLE_MODES,
+                        help='Also download the first, last, random or all the segments of each variant and compare their measured bitrate with its BANDWIDTH and AVERAGE-BANDWIDTH')
+
+    parser.add_argument('--measure-count',
+                        action='store',
+                        type=int,
+                        default=3,
+                        help='Number of segments to download per variant with --measure first, last or random (default: 3)')
+
+    parser.add_argument('--measure-tolerance',
+                        action='store',
+                        type=float,
+                        default=bitrate.DEFAULT_TOLERANCE,
+                        help='Percentage the measured bitrate may differ from the advertised one (default: %d)' % bitrate.DEFAULT_TOLERANCE)
+
+    parser.add_argument('--measure-concurrency',
+                        action='store',
+                        type=int,
+                        default=4,
+                        help='Maximum number of variants to measure at the same time for each master playlist (default: 4)')
+# enddef add_arguments()
+
+def check_arguments(parser, args):
+    if not args.bandwidths and not args.ladders and not args.measure:
+        argument_error(parser, "You must either specify the expected bandwidths with --bandwidths, provide a ladder file via the --ladders argument or measure the bitrates with --measure", 2)
+
+    if args.measure and (args.measure_count < 1 or args.measure_concurrency < 1 or args.measure_tolerance < 0):
+        argument_error(parser, "--measure-count and --measure-concurrency must be at least 1 and --measure-tolerance can't be negative", 2)
+
+    # Checked once here like the ladder files are, the checks of the URLs take the list as it is
+    args.ref_bandwidths = None
+    if args.bandwidths:
+        args.ref_bandwidths = args.bandwidths.split()
+        for bandwidth in args.ref_bandwidths:
+            if not bandwidth.isdigit():
+                argument_error(parser, "Invalid bandwidth value in --bandwidths: %s is not an integer" % bandwidth, 2)
+
+        if args.variance_percent:
+            get_variance_ladder(args.ref_bandwidths, float(args.variance_percent))
+
+    args.ladder_profiles = None
+    if args.ladders:
+        from hlstools.ladders import LadderError, load_ladders
+        try:
+            args.ladder_profiles = load_ladders(args.ladders, args.unordered, args.variance_percent)
+        except LadderError as error:
+            parser.exit(2, "Error: %s\n" % error)
+# enddef check_arguments()
+
+# Returns the expected bandwidths and options for a URL, from the --ladders file or the command-line
+def get_profile(url, args, ref_bandwidths):
+    if args.ladder_profiles is not None:
+        profile = args.ladder_profiles.lookup(url)
+        if profile is not None:
+            return profile
+
+    if ref_bandwidths:
+        from hlstools.ladders import LadderProfile
+        return LadderProfile('--bandwidths', ref_bandwidths, args.unordered, args.variance_percent)
+
+    return None
+# enddef get_profile()
+
+def get_bandwidths(playlists):
+    bandwidths = []
+    for playlist in playlists:
+        bandwidths.append(str(playlist.stream_info.bandwidth))
+
+    return bandwidths
+# enddef get_bandwidths()
+
+def check_ordered_bandwidths(playlists, ref_bandwidths, verbose, out_stream=sys.stdout):
+    return_code = 0
+    error_msg = ""
+
+    play_bandwidths = get_bandwidths(playlists)
+
+    if len(ref_bandwidths) > len(play_bandwidths):
+        return_code = set_return_code(return_code, 2)     # Critical since we must at least have the required bandwidths
+        error_msg += "Missing bandwidths,"
+
+    if len(ref_bandwidths) < len(play_bandwidths):
+        return_code = set_return_code(return_code, 1)     # Warning since we are not expecting more than the required bandwidths
+        error_msg += "Additional bandwidths,"
+
+    out_of_order_flag = False
+    missing_flag = False
+    for idx, bandwidth in enumerate(ref_bandwidths):
+        try:
+            if play_bandwidths.index(bandwidth) != idx:
+                if not out_of_order_flag:
+                    return_code = set_return_code(return_code, 1)   # Warning since we have the bandwidth but it's just not in the correct order
+                    error_msg += "Incorrect bandwidth order,"
+                    out_of_order_flag = True
+
+                if verbose:
+                    print >> out_stream, "\tIncorrect order for bandwidth", bandwidth, "expected index:", idx, "got index:", play_bandwidths.index(bandwidth)
+            else:
+                if verbose:
+                    print >> out_stream, "\tFound bandwidth", bandwidth, "at the correct index", idx
+        except ValueError:
+            if not missing_flag:
+                return_code = set_return_code(return_code, 2)   # Critical since we are missing this bandwidth
+                error_msg += "Missing bandwidths,"
+                missing_flag = True
+
+            if verbose:
+                print >> out_stream, "\tMissing bandwidth", bandwidth
+
+
+    return (return_code, error_msg)
+# enddef check_ordered_bandwidths()
+
+def check_unordered_bandwidths(playlists, ref_bandwidths, verbose, out_stream=sys.stdout):
+    return_code = 0
+    error_msg = ""
+
+    play_bandwidths = get_bandwidths(playlists)
+
+    if len(ref_bandwidths) > len(play_bandwidths):
+        return_code = set_return_code(return_code, 2)     # Critical since we must at least have the required bandwidths
+        error_msg += "Missing bandwidths,"
+
+    if len(ref_bandwidths) < len(play_bandwidths):
+        return_code = set_return_code(return_code, 1)     # Warning since we are not expecting more than the required bandwidths
+        error_msg += "Additional bandwidths,"
+
+    for idx, bandwidth in enumerate(ref_bandwidths):
+        missing_flag = False
+
+        try:
+            # This will throw an exception if the bandwidth is not in the play_bandwidths list
+            play_bandwidths.index(bandwidth)
+
+            if verbose:
+                print >> out_stream, "\tFound bandwidth", bandwidth
+
+        except ValueError:
+            if not missing_flag:
+                return_code = set_return_code(return_code, 2)   # Critical since we are missing this bandwidth
+                error_msg += "Missing bandwidths,"
+                missing_flag = True
+
+            if verbose:
+                print >> out_stream, "\tMissing bandwidth", bandwidth
+
+
+    return (return_code, error_msg)
+# endef check_unordered_bandwidths()
+
+class VarianceLadder(object):
+    """
+    The expected bandwidths with their +/- variance, compiled once for the whole run.
+
+    match() assigns each playlist bandwidth to at most one expected bandwidth, and each
+    expected bandwidth is claimed at most once, so overlapping ranges of a close ladder
+    can't all match the same playlist. Masters with the same bandwidths get the same
+    answer, so the assignments are memoized.
+    """
+
+    MAX_MEMO = 4096
+
+    def __init__(self, ref_bandwidths, variance):
+        self.ref_bandwidths = ref_bandwidths
+        self.min_bandwidths = get_min_bandwidths(ref_bandwidths, variance)
+        self.max_bandwidths = get_max_bandwidths(ref_bandwidths, variance)
+        # Expected bandwidth indexes sorted by the top of their range, for the greedy assignment
+        self._by_max = sorted(range(len(ref_bandwidths)), key=lambda idx: (self.max_bandwidths[idx], self.min_bandwidths[idx]))
+        self._memo = {}
+
+    def in_range(self, ref_idx, bandwidth):
+        return self.min_bandwidths[ref_idx] <= bandwidth <= self.max_bandwidths[ref_idx]
+    # enddef in_range()
+
+    def match(self, play_bandwidths):
+        """
+        Returns the index of the matched expected bandwidth for each playlist bandwidth, -1 when there is none.
+        """
+        play_bandwidths = tuple(int(bandwidth) for bandwidth in play_bandwidths)
+        found = self._memo.get(play_bandwidths)
+        if found is None:
+            found = self._assign(play_bandwidths)
+            if len(self._memo) >= self.MAX_MEMO:
+                self._memo.clear()
+            self._memo[play_bandwidths] = found
+
+        return list(found)
+    # enddef match()
+
+    def _assign(self, play_bandwidths):
+        # The usual case: every bandwidth is within the range of the one at the same index
+        if len(play_bandwidths) == len(self.ref_bandwidths) and \
+                all(self.in_range(idx, bandwidth) for idx, bandwidth in enumerate(play_bandwidths)):
+            return tuple(range(len(play_bandwidths)))
+
+        # Otherwise take the ranges by increasing top and give each one the lowest unclaimed bandwidth
+        # inside it, which matches as many bandwidths as possible
+        found = [-1] * len(play_bandwidths)
+        unclaimed = sorted((bandwidth, idx) for idx, bandwidth in enumerate(play_bandwidths))
+        for ref_idx in self._by_max:
+            pos = bisect_left(unclaimed, (self.min_bandwidths[ref_idx], -1))
+            if pos < len(unclaimed) and unclaimed[pos][0] <= self.max_bandwidths[ref_idx]:
+                found[unclaimed[pos][1]] = ref_idx
+                del unclaimed[pos]
+
+        # Swap matches back to the same index when both bandwidths allow it, so a ladder in the expected
+        # order isn't reported as out of order just because two ranges overlap
+        for idx in range(min(len(found), len(self.ref_bandwidths))):
+            if found[idx] == idx or not self.in_range(idx, play_bandwidths[idx]):
+                continue
+            if idx not in found:
+                found[idx] = idx
+            else:
+                other = found.index(idx)
+                if found[idx] == -1 or self.in_range(found[idx], play_bandwidths[other]):
+                    found[other] = found[idx]
+                    found[idx] = idx
+
+        return tuple(found)
+    # enddef _assign()
+# endclass VarianceLadder
+
+_ladders = {}
+_ladders_lock = threading.Lock()
+
+# Returns the compiled VarianceLadder for a list of expected bandwidths, compiling it on first use
+def get_variance_ladder(ref_bandwidths, variance):
+    key = (tuple(ref_bandwidths), variance)
+    with _ladders_lock:
+        ladder = _ladders.get(key)
+        if ladder is None:
+            ladder = _ladders[key] = VarianceLadder(ref_bandwidths, variance)
+
+    return ladder
+# enddef get_variance_ladder()
+
+def check_variance_bandwidths(playlists, ref_bandwidths, variance, verbose, unordered, out_stream=sys.stdout):
+    return_code = 0
+    error_msg = ""
+
+    ladder = get_variance_ladder(ref_bandwidths, variance)
+    play_bandwidths = get_bandwidths(playlists)
+    found_indexes = ladder.match(play_bandwidths)
+
+    if len(ref_bandwidths) > len(play_bandwidths):
+        return_code = set_return_code(return_code, 2)     # Critical since we must at least have the required bandwidths
+        error_msg += "Missing bandwidths,"
+
+    if len(ref_bandwidths) < len(play_bandwidths):
+        return_code = set_return_code(return_code, 1)     # Warning since we are not expecting more than the required bandwidths
+        error_msg += "Additional bandwidths,"
+
+    for idx, play_bandwidth in enumerate(play_bandwidths):
+        bandwidth = int(play_bandwidth)
+        found_idx = found_indexes[idx]
+        if found_idx == -1:
+            if len(ref_bandwidths) == len(play_bandwidths):
+                return_code = set_return_code(return_code, 2)   # Critical since we have a bandwidth that's not expected
+                error_msg += "Mismatched bandwidths,"
+            else:
+                return_code = set_return_code(return_code, 1)   # Warning since we have an extra bandwidth
+                error_msg += "Additional bandwidths,"
+
+            if verbose:
+                print >> out_stream, "\tBandwidth:", bandwidth, "is not expected"
+        else:
+            if found_idx == idx or (found_idx >= 0 and unordered):
+                if verbose:
+                    print >> out_stream, "\tBandwidth", bandwidth, "within variance of", ref_bandwidths[found_idx]
+            else:
+                return_code = set_return_code(return_code, 1)   # Warning since we have the bandwidth but it's just not in the correct order
+                error_msg += "Incorrect bandwidth order,"
+                if verbose:
+                    print >> out_stream, "\tIncorrect order for bandwidth", play_bandwidth, "expected index:", idx, "got index:", found_idx
+
+
+    return (return_code, error_msg)
+# enddef check_variance_bandwidths()
+
+# The bandwidths are integers, check_arguments() and the ladder files make sure of it
+def get_min_bandwidths(ref_bandwidths, variance):
+    min_bandwidths = []
+    for bandwidth in ref_bandwidths:
+        min_bandwidth = int(int(bandwidth) - (int(bandwidth) * (variance / 100)))
+        min_bandwidths.append(min_bandwidth)
+
+    return min_bandwidths
+
+# endef get_min_bandwidths()
+
+# The bandwidths are integers, check_arguments() and the ladder files make sure of it
+def get_max_bandwidths(ref_bandwidths, variance):
+    max_bandwidths = []
+    for bandwidth in ref_bandwidths:
+        max_bandwidth = int(int(bandwidth) + (int(bandwidth) * (variance / 100)))
+        max_bandwidths.append(max_bandwidth)
+
+    return max_bandwidths
+
+# endef get_max_bandwidths()
+
+# Runs the bandwidth check on an already loaded master playlist and prints the result
+def check_master(url, m3u8_obj, args, ref_bandwidths, out_stream):
+    profile = get_profile(url, args, ref_bandwidths)
+    if profile is None and not args.measure:
+        print_brief(args.timestamp, out_stream, "WARNING: URL=", url, ">> No expected bandwidths for this URL")
+        return 1
+
+    if args.verbose:
+        print >> out_stream, "Checking URL:", url
+
+    result = (0, "")
+    if profile is not None and profile.variance_percent:
+        result = check_variance_bandwidths(m3u8_obj.playlists, profile.ref_bandwidths, float(profile.variance_percent), args.verbose, profile.unordered, out_stream)
+    elif profile is not None:
+        if profile.unordered:
+            result = check_unordered_bandwidths(m3u8_obj.playlists, profile.ref_bandwidths, args.verbose, out_stream)
+        else:
+            result = check_ordered_bandwidths(m3u8_obj.playlists, profile.ref_bandwidths, args.verbose, out_stream)
+
+    if args.measure:
+        measured = bitrate.check_measured_bitrates(m3u8_obj, args, out_stream)
+        result = (set_return_code(result[0], measured[0]), result[1] + measured[1])
+
+    if result[0] == 0:
+        print_brief(args.timestamp, out_stream, "OK: URL=", url)
+    else:
+        print_brief(args.timestamp, out_stream, render_status(result[0]), "URL=", url, ">>", result[1][:-1])
+
+    return result[0]
+# enddef check_master()
+
+# Checks a single master playlist and returns the return code along with the output for it.
+# The output is buffered so parallel jobs don't interleave their lines.
+def check_url(url, args, ref_bandwidths):
+    out_stream = StringIO()
+
+    # No need to download the master if there is nothing to check it against
+    if verify_url(url) == True and not args.measure and get_profile(url, args, ref_bandwidths) is None:
+        print_brief(args.timestamp, out_stream, "WARNING: URL=", url, ">> No expected bandwidths for this URL")
+        return (1, out_stream.getvalue())
+
+    result_code = 2
+
+    m3u8_obj = load_master(url, args.timestamp, out_stream, ">> Does not contain any variant playlists")
+    if m3u8_obj is not None:
+        result_code = check_master(url, m3u8_obj, args, ref_bandwidths, out_stream)
+
+    return (result_code, out_stream.getvalue())
+# enddef check_url()
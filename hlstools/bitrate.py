@@ -0,0 +1,188 @@
+"""
+Measured bitrate check: do the segments of each variant match the bitrate its
+master playlist advertises?
+
+A sample of the segments of every variant is downloaded and thrown away as it
+arrives, only the sizes and download times are kept. The bitrate of a segment
+is its size in bits over its #EXTINF duration:
+* the peak (highest segment) bitrate above BANDWIDTH is CRITICAL,
+* the average bitrate above AVERAGE-BANDWIDTH is CRITICAL, below it a WARNING,
+* when every segment was downloaded, a peak below BANDWIDTH is a WARNING too
+  (a sample is unlikely to hold the real peak),
+* a download throughput below the peak bitrate is a WARNING, the variant
+  can't be played from here without stalling,
+all with the tolerance given in percent. An #EXT-X-BYTERANGE segment the
+server answered with the whole file (200 instead of 206) is a WARNING, only
+the length of its range counts towards the bitrates.
+"""
+
+import sys
+from collections import namedtuple
+from itertools import izip
+from multiprocessing.pool import ThreadPool
+from urlparse import urljoin
+
+from hlstools import fetch
+from hlstools.common import set_return_code
+from hlstools.segments import sample_segments
+
+DEFAULT_TOLERANCE = 10.0
+
+Segment = namedtuple('Segment', ['uri', 'duration', 'byterange'])
+
+Measurement = namedtuple('Measurement', ['segments', 'complete', 'peak_bitrate', 'average_bitrate', 'throughput', 'ignored_ranges'])
+
+# Yields the Segments of a media playlist, the byterange is None or the (offset, length) to request
+def iter_segments(content):
+    duration = None
+    byterange = None
+    last_uri = None
+    next_offset = 0
+
+    for line in content.splitlines():
+        line = line.strip()
+        if line.startswith('#EXTINF:'):
+            duration = float(line[len('#EXTINF:'):].split(',', 1)[0])
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            length, _, offset = line[len('#EXT-X-BYTERANGE:'):].partition('@')
+            byterange = (int(offset) if offset else None, int(length))
+        elif line and not line.startswith('#'):
+            if byterange is not None:
+                # Without an offset the range starts where the previous range of the same URI ended
+                offset, length = byterange
+                if offset is None:
+                    offset = next_offset if line == last_uri else 0
+                byterange = (offset, length)
+                next_offset = offset + length
+            last_uri = line
+
+            yield Segment(line, duration, byterange)
+            duration = None
+            byterange = None
+# enddef iter_segments()
+
+# Downloads a sample of the segments of a media playlist.
+# Returns (None, Measurement), or (error message, None) when a download fails or the playlist can't be read.
+def measure_stream(stream_url, mode, count):
+    session = fetch.get_session()
+
+    try:
+        response = session.fetch(stream_url)
+    except IOError as error:
+        return (str(error), None)
+
+    try:
+        all_segments = list(iter_segments(response.body))
+    except ValueError as error:
+        return ("Invalid playlist: %s" % error, None)
+
+    sampled = [segment for segment in sample_segments(all_segments, mode, count) if segment.duration]
+    if len(sampled) < 1:
+        return ("No segments", None)
+
+    total_bytes = 0
+    total_duration = 0.0
+    downloaded_bytes = 0
+    total_time = 0.0
+    peak_bitrate = 0
+    ignored_ranges = 0
+    for segment in sampled:
+        headers = None
+        if segment.byterange is not None:
+            offset, length = segment.byterange
+            headers = {'Range': 'bytes=%d-%d' % (offset, offset + length - 1)}
+
+        try:
+            download = session.download(urljoin(response.url, segment.uri), headers)
+        except IOError as error:
+            return ("%s: %s" % (segment.uri, error), None)
+
+        # A server ignoring the Range sends the whole file, only the range is the segment
+        size = download.size
+        if segment.byterange is not None and download.status != 206:
+            ignored_ranges += 1
+            size = min(size, length)
+
+        total_bytes += size
+        total_duration += segment.duration
+        downloaded_bytes += download.size
+        total_time += download.download_time
+        peak_bitrate = max(peak_bitrate, int(size * 8 / segment.duration))
+
+    throughput = int(downloaded_bytes * 8 / total_time) if total_time > 0 else None
+
+    return (None, Measurement(len(sampled), len(sampled) == len(all_segments), peak_bitrate,
+                              int(total_bytes * 8 / total_duration), throughput, ignored_ranges))
+# enddef measure_stream()
+
+# Returns the return code and the problems found comparing a measurement with the stream info of its variant
+def compare_bitrates(stream_info, measurement, tolerance):
+    return_code = 0
+    problems = []
+    above = 1 + tolerance / 100.0
+    below = 1 - tolerance / 100.0
+
+    if measurement.peak_bitrate > stream_info.bandwidth * above:
+        return_code = set_return_code(return_code, 2)
+        problems.append("peak bitrate %d above BANDWIDTH %d" % (measurement.peak_bitrate, stream_info.bandwidth))
+    elif measurement.complete and measurement.peak_bitrate < stream_info.bandwidth * below:
+        return_code = set_return_code(return_code, 1)
+        problems.append("peak bitrate %d below BANDWIDTH %d" % (measurement.peak_bitrate, stream_info.bandwidth))
+
+    average_bandwidth = stream_info.average_bandwidth
+    if average_bandwidth:
+        if measurement.average_bitrate > average_bandwidth * above:
+            return_code = set_return_code(return_code, 2)
+            problems.append("average bitrate %d above AVERAGE-BANDWIDTH %d" % (measurement.average_bitrate, average_bandwidth))
+        elif measurement.average_bitrate < average_bandwidth * below:
+            return_code = set_return_code(return_code, 1)
+            problems.append("average bitrate %d below AVERAGE-BANDWIDTH %d" % (measurement.average_bitrate, average_bandwidth))
+
+    if measurement.throughput is not None and measurement.throughput < measurement.peak_bitrate:
+        return_code = set_return_code(return_code, 1)
+        problems.append("download throughput %d below peak bitrate %d" % (measurement.throughput, measurement.peak_bitrate))
+
+    if measurement.ignored_ranges:
+        return_code = set_return_code(return_code, 1)
+        problems.append("%d #EXT-X-BYTERANGE segments answered with 200 instead of 206" % measurement.ignored_ranges)
+
+    return (return_code, problems)
+# enddef compare_bitrates()
+
+# Measures the variants of a master playlist, `concurrency` variants at a time.
+# Returns the return code and the error message, in the same form as the other bandwidth checks.
+def check_measured_bitrates(master_playlist, args, out_stream=sys.stdout):
+    return_code = 0
+    error_msg = ""
+
+    variants = master_playlist.playlists
+    stream_urls = [master_playlist.base_uri + variant.uri for variant in variants]
+
+    def measure(stream_url):
+        return measure_stream(stream_url, args.measure, args.measure_count)
+
+    pool = ThreadPool(max(1, min(args.measure_concurrency, len(stream_urls))))
+    try:
+        for variant, (error, measurement) in izip(variants, pool.imap(measure, stream_urls)):
+            if error is not None:
+                return_code = set_return_code(return_code, 2)
+                error_msg += "%s: %s," % (variant.uri, error)
+                if args.verbose:
+                    print >> out_stream, "\tMeasuring %s failed: %s" % (variant.uri, error)
+                continue
+
+            variant_code, problems = compare_bitrates(variant.stream_info, measurement, args.measure_tolerance)
+            return_code = set_return_code(return_code, variant_code)
+            for problem in problems:
+                error_msg += "%s %s," % (variant.uri, problem)
+
+            if args.verbose:
+                print >> out_stream, "\tMeasured %s over %d segments: peak %d bps, average %d bps, download %s bps (BANDWIDTH %d, AVERAGE-BANDWIDTH %s)" % (
+                    variant.uri, measurement.segments, measurement.peak_bitrate, measurement.average_bitrate,
+                    measurement.throughput, variant.stream_info.bandwidth, variant.stream_info.average_bandwidth)
+    finally:
+        pool.close()
+        pool.join()
+
+    return (return_code, error_msg)
+# enddef check_measured_bitrates()
@@ -0,0 +1,71 @@
+"""
+Per-host circuit breaker for the Session.
+
+After `threshold` consecutive failed requests to a host (connection errors,
+timeouts and 5xx responses) the circuit of that host opens and its requests
+fail straight away with CircuitOpenError, instead of each one waiting for
+the timeouts again. Once `cooldown` seconds have passed a single trial
+request is let through: the circuit closes again if it succeeds and stays
+open for another cooldown if it fails.
+"""
+
+import threading
+import time
+import urllib2
+
+DEFAULT_THRESHOLD = 5
+DEFAULT_COOLDOWN = 30.0
+
+
+class CircuitOpenError(urllib2.URLError):
+    pass
+# endclass CircuitOpenError
+
+
+class HostState(object):
+
+    def __init__(self):
+        self.failures = 0
+        self.open_until = None
+        self.trial = False
+# endclass HostState
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    # Raises CircuitOpenError when the circuit of the host is open
+    def before_request(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state.open_until is None:
+                return
+
+            if state.trial or time.time() < state.open_until:
+                raise CircuitOpenError('Circuit open for %s after %d failed requests' % (host, state.failures))
+
+            state.trial = True
+    # enddef before_request()
+
+    def record_success(self, host):
+        with self._lock:
+            self._hosts.pop(host, None)
+    # enddef record_success()
+
+    def record_failure(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = HostState()
+
+            state.failures += 1
+            state.trial = False
+            if state.failures >= self.threshold:
+                state.open_until = time.time() + self.cooldown
+    # enddef record_failure()
+# endclass CircuitBreaker
@@ -0,0 +1,96 @@
+"""
+Persistent playlist cache for conditional GETs.
+
+Stores the ETag/Last-Modified validators and the parsed summary of each
+playlist by URL in a SQLite file. A rerun sends the validators and reuses the
+summary when the server answers 304 Not Modified, skipping both the download
+and the parse. The least recently used entries are evicted past max_entries.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+from hlstools.playlist import summary_from_dict, summary_to_dict
+
+DEFAULT_MAX_ENTRIES = 10000
+
+class CacheEntry(object):
+
+    def __init__(self, etag, last_modified, summary):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.summary = summary
+
+    def get_validators(self):
+        """
+        Returns the conditional request headers for this entry.
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        return headers
+    # enddef get_validators()
+# endclass CacheEntry
+
+
+class PlaylistCache(object):
+
+    def __init__(self, filename, max_entries=DEFAULT_MAX_ENTRIES):
+        self.filename = filename
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS playlists ('
+                         'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, summary TEXT, last_used REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS playlists_last_used ON playlists (last_used)')
+        # The cap may have been lowered since the file was written
+        self._evict()
+        self._db.commit()
+
+    def get(self, url):
+        with self._lock:
+            row = self._db.execute('SELECT etag, last_modified, summary FROM playlists WHERE url = ?', (url,)).fetchone()
+
+        if row is None:
+            return None
+
+        try:
+            summary = summary_from_dict(json.loads(row[2]))
+        except KeyError:
+            # Stored by an older version without the renditions, the playlist is downloaded again
+            return None
+
+        return CacheEntry(row[0], row[1], summary)
+    # enddef get()
+
+    def touch(self, url):
+        with self._lock:
+            self._db.execute('UPDATE playlists SET last_used = ? WHERE url = ?', (time.time(), url))
+            self._db.commit()
+    # enddef touch()
+
+    def put(self, url, etag, last_modified, summary):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO playlists (url, etag, last_modified, summary, last_used) VALUES (?, ?, ?, ?, ?)',
+                             (url, etag, last_modified, json.dumps(summary_to_dict(summary)), time.time()))
+            self._evict()
+            self._db.commit()
+    # enddef put()
+
+    def _evict(self):
+        count = self._db.execute('SELECT COUNT(*) FROM playlists').fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute('DELETE FROM playlists WHERE url IN (SELECT url FROM playlists ORDER BY last_used LIMIT ?)',
+                             (count - self.max_entries,))
+    # enddef _evict()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+    # enddef close()
+# endclass PlaylistCache
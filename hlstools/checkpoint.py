@@ -0,0 +1,71 @@
+"""
+Checkpoint file for resuming an interrupted --file sweep.
+
+The results are written in the same order as the URLs, so the progress of a
+sweep is just the number of URLs written so far (plus the worst return code
+seen and the number of URLs per return code), which keeps the checkpoint the
+same size however long the list is.
+"""
+
+import json
+import os
+import time
+
+SAVE_INTERVAL = 1.0
+
+class Checkpoint(object):
+
+    def __init__(self, filename, source):
+        self.filename = filename
+        self.source = source
+        self.done = 0
+        self.result_code = 0
+        self.codes = {}
+        self._saved_at = 0
+
+    def load(self):
+        """
+        Read the progress of a previous run over the same source. Returns the number of URLs to skip.
+        """
+        try:
+            with open(self.filename) as checkpoint_file:
+                state = json.load(checkpoint_file)
+        except (IOError, ValueError):
+            return 0
+
+        if state.get('source') == self.source:
+            self.done = int(state.get('done', 0))
+            self.result_code = int(state.get('result_code', 0))
+            self.codes = dict((int(code), count) for code, count in state.get('codes', {}).items())
+
+        return self.done
+    # enddef load()
+
+    def update(self, result_code):
+        self.done += 1
+        self.codes[result_code] = self.codes.get(result_code, 0) + 1
+        if result_code > self.result_code:
+            self.result_code = result_code
+
+        # Saving after every URL would cost more than the check on a fast CDN, a crash just re-checks a few URLs
+        if time.time() - self._saved_at >= SAVE_INTERVAL:
+            self.save()
+    # enddef update()
+
+    def save(self):
+        # Write to a temporary file and rename it so a crash never leaves a truncated checkpoint
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as checkpoint_file:
+            json.dump({'source': self.source, 'done': self.done, 'result_code': self.result_code,
+                       'codes': dict((str(code), count) for code, count in self.codes.items())}, checkpoint_file)
+        os.rename(tmp_filename, self.filename)
+        self._saved_at = time.time()
+    # enddef save()
+
+    def remove(self):
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
+    # enddef remove()
+# endclass Checkpoint
@@ -0,0 +1,77 @@
+"""
+Client of the check daemon (hls-check-daemon.py).
+
+Only uses the standard library, so a Sensu check running it starts in a few
+milliseconds without importing m3u8 or the rest of hlstools.
+"""
+
+import httplib
+import json
+import socket
+
+DEFAULT_PORT = 8765
+DEFAULT_TIMEOUT = 60.0
+
+# Sensu return code when the daemon can't be asked
+UNKNOWN = 3
+
+class DaemonError(Exception):
+    pass
+# endclass DaemonError
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    """
+    HTTP over a Unix socket.
+    """
+
+    def __init__(self, path, timeout=DEFAULT_TIMEOUT):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+    # enddef connect()
+# endclass UnixHTTPConnection
+
+
+# Splits a HOST:PORT or HOST address, the port defaults to DEFAULT_PORT
+def parse_address(address):
+    host, separator, port = address.rpartition(':')
+    if not separator:
+        return (address, DEFAULT_PORT)
+
+    return (host, int(port))
+# enddef parse_address()
+
+def run_check(argv, address='127.0.0.1', socket_path=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Runs a check command line (eg. ['availability', URL]) on the daemon.
+    Returns the return code, the stdout and the stderr output of the check. Raises DaemonError when the daemon can't be asked.
+    """
+    if socket_path:
+        conn = UnixHTTPConnection(socket_path, timeout)
+    else:
+        host, port = parse_address(address)
+        conn = httplib.HTTPConnection(host, port, timeout=timeout)
+
+    try:
+        conn.request('POST', '/check', json.dumps(argv), {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        body = response.read()
+    except (socket.error, httplib.HTTPException) as error:
+        raise DaemonError('Error asking the daemon: %s' % (error or error.__class__.__name__))
+    finally:
+        conn.close()
+
+    if response.status != 200:
+        raise DaemonError('Error from the daemon: %d %s %s' % (response.status, response.reason, body.strip()))
+
+    try:
+        result = json.loads(body)
+        return (result['code'], result['stdout'], result['stderr'])
+    except (ValueError, KeyError, TypeError):
+        raise DaemonError('Invalid response from the daemon: %r' % body[:200])
+# enddef run_check()
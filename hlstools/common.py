@@ -0,0 +1,440 @@
+"""
+Helpers shared by all the HLS tools scripts.
+"""
+
+import gzip
+import os
+import sys
+import time
+from collections import deque
+from itertools import imap, islice
+from multiprocessing.pool import ThreadPool
+from urlparse import urlparse
+
+from hlstools import fetch
+from hlstools.breaker import DEFAULT_COOLDOWN, DEFAULT_THRESHOLD, CircuitBreaker
+from hlstools.cache import DEFAULT_MAX_ENTRIES, PlaylistCache
+from hlstools.checkpoint import Checkpoint
+from hlstools.fetch import DeadlineExceeded
+from hlstools.memo import DEFAULT_MAX_MB, FetchMemo
+from hlstools.metrics import METRIC_FORMATS, Metrics
+from hlstools.throttle import Throttle
+
+def add_session_arguments(parser):
+    """Add the arguments setting up the Session (caching, timeouts, retries, circuit breaker and throttling) to an argparse parser.
+    """
+    parser.add_argument('--cache',
+                        action='store',
+                        help='SQLite file to cache playlists in. Reruns make conditional requests and skip the parse for unchanged playlists')
+
+    parser.add_argument('--cache-size',
+                        action='store',
+                        type=int,
+                        default=DEFAULT_MAX_ENTRIES,
+                        help='Maximum number of playlists kept in the --cache file, the least recently used are dropped first (default: %d)' % DEFAULT_MAX_ENTRIES)
+
+    parser.add_argument('--connect-timeout',
+                        action='store',
+                        type=float,
+                        default=5.0,
+                        help='Seconds to wait for a connection to a server (default: 5)')
+
+    parser.add_argument('--read-timeout',
+                        action='store',
+                        type=float,
+                        default=20.0,
+                        help='Seconds to wait for a server to send more data (default: 20)')
+
+    parser.add_argument('--retries',
+                        action='store',
+                        type=int,
+                        default=2,
+                        help='Number of times to retry a request after a connection error, a timeout or a 429/5xx response (default: 2)')
+
+    parser.add_argument('--retry-backoff',
+                        action='store',
+                        type=float,
+                        default=0.5,
+                        help='Seconds to wait before the first retry, doubled for every next retry and jittered by +/-50%% (default: 0.5)')
+
+    parser.add_argument('--breaker-threshold',
+                        action='store',
+                        type=int,
+                        default=DEFAULT_THRESHOLD,
+                        help='Number of failed requests in a row after which the requests to a host fail straight away, 0 to never stop (default: %d)' % DEFAULT_THRESHOLD)
+
+    parser.add_argument('--breaker-cooldown',
+                        action='store',
+                        type=float,
+                        default=DEFAULT_COOLDOWN,
+                        help='Seconds before a host that failed --breaker-threshold times is tried again (default: %d)' % DEFAULT_COOLDOWN)
+
+    parser.add_argument('--host-concurrency',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Maximum number of requests in flight to a host. The limit is halved when the host answers 429/503, times out or slows down, and grows back while it is healthy. 0 for no limit (default: 0)')
+
+    parser.add_argument('--rate-limit',
+                        action='store',
+                        type=float,
+                        default=0,
+                        help='Maximum number of requests per second to a host, adapting like --host-concurrency. 0 for no limit (default: 0)')
+# enddef add_session_arguments()
+
+def add_common_arguments(parser, brief=True):
+    """Add the arguments every script takes to an argparse parser.
+    """
+    parser.add_argument('-f', '--file',
+                        action='store',
+                        help='File of URLs to load, "-" for stdin. Files ending in .gz are decompressed. This overrides a URL provided on the command-line')
+
+    if brief:
+        parser.add_argument('-v', '--verbose',
+                            action='store_true',
+                            default=False,
+                            help='Display verbose output')
+
+        parser.add_argument('-t', '--timestamp',
+                            action='store_true',
+                            default=False,
+                            help='Display timestamp in the brief output')
+
+    parser.add_argument('-j', '--jobs',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='Number of master playlists to process in parallel when using --file (default: 1)')
+
+    parser.add_argument('--checkpoint',
+                        action='store',
+                        help='File to record the progress through --file in. A rerun after an interruption skips the URLs already done. The file is removed once the whole list is done')
+
+    add_session_arguments(parser)
+
+    parser.add_argument('--deadline',
+                        action='store',
+                        type=float,
+                        help='Seconds the whole run may take. The URLs done by then are reported, the run is a WARNING if any were left unchecked')
+
+    parser.add_argument('--metrics',
+                        action='store',
+                        metavar='FILE',
+                        help='Time every request by phase (dns, connect, tls, ttfb, download, parse) and write per host latency metrics to this file, "-" for stdout')
+
+    parser.add_argument('--metrics-format',
+                        action='store',
+                        choices=METRIC_FORMATS,
+                        default='sensu',
+                        help='Format of the --metrics output: Sensu/Graphite metric lines or a Prometheus text file (default: sensu)')
+
+    parser.add_argument('--shard',
+                        action='store',
+                        metavar='I/N',
+                        help='Only check the URLs of shard I of N of the --file list, eg. 2/4. The URLs are spread over the shards by a consistent hash, so the same list can be split over several processes or hosts')
+
+    parser.add_argument('--shard-dir',
+                        action='store',
+                        metavar='DIR',
+                        help='Directory to write the results of the --shard to, for "hls-check.py merge" to combine')
+
+    parser.add_argument('--memo-size',
+                        action='store',
+                        type=int,
+                        default=DEFAULT_MAX_MB,
+                        metavar='MB',
+                        help='Playlists shared by several masters or listed more than once are only downloaded once per run, up to this many megabytes are kept for reuse. 0 downloads every occurrence (default: %d)' % DEFAULT_MAX_MB)
+
+    parser.add_argument('url',
+                        nargs='?', default='NO_URL',
+                        action='store',
+                        help='The url of the master m3u8 playlist')
+# enddef add_common_arguments()
+
+# Reports invalid arguments the way the scripts do: the error, the usage and the exit code. It all goes
+# through the parser, so a parser with its own output and exit, like the daemon's, catches all of it.
+def argument_error(parser, message, error_code):
+    parser._print_message("Error: %s\n\n\n" % message, sys.stderr)
+    parser.print_help()
+    parser.exit(error_code)
+# enddef argument_error()
+
+def check_common_arguments(parser, args, error_code):
+    if args.url == "NO_URL" and not args.file:
+        argument_error(parser, "You must either specify a URL on the command-line or provide a filename via the --file argument", error_code)
+
+    if args.jobs < 1:
+        argument_error(parser, "--jobs must be at least 1", error_code)
+
+    if args.deadline is not None and args.deadline <= 0:
+        argument_error(parser, "--deadline must be more than 0", error_code)
+
+    if args.shard is not None:
+        from hlstools.shards import parse_shard
+        try:
+            args.shard = parse_shard(args.shard)
+        except ValueError as error:
+            argument_error(parser, str(error), error_code)
+
+    if (args.shard is not None and not args.file) or (args.shard_dir and args.shard is None):
+        argument_error(parser, "--shard needs a --file to split and --shard-dir needs a --shard", error_code)
+
+    if args.shard_dir and not os.path.isdir(args.shard_dir):
+        argument_error(parser, "--shard-dir %s is not a directory" % args.shard_dir, error_code)
+
+    if args.memo_size < 0:
+        argument_error(parser, "--memo-size can't be negative", error_code)
+
+    check_session_arguments(parser, args, error_code)
+# enddef check_common_arguments()
+
+def check_session_arguments(parser, args, error_code):
+    if args.connect_timeout <= 0 or args.read_timeout <= 0:
+        argument_error(parser, "--connect-timeout and --read-timeout must be more than 0", error_code)
+
+    if args.retries < 0 or args.retry_backoff < 0 or args.breaker_threshold < 0 or args.breaker_cooldown < 0:
+        argument_error(parser, "--retries, --retry-backoff, --breaker-threshold and --breaker-cooldown can't be negative", error_code)
+
+    if args.host_concurrency < 0 or args.rate_limit < 0:
+        argument_error(parser, "--host-concurrency and --rate-limit can't be negative", error_code)
+# enddef check_session_arguments()
+
+# Applies the command-line options to the Session shared by the run
+def setup_session(args):
+    session = fetch.get_session()
+    session.connect_timeout = args.connect_timeout
+    session.read_timeout = args.read_timeout
+    session.retries = args.retries
+    session.retry_backoff = args.retry_backoff
+
+    if args.breaker_threshold > 0:
+        session.breaker = CircuitBreaker(args.breaker_threshold, args.breaker_cooldown)
+
+    if args.host_concurrency or args.rate_limit:
+        session.throttle = Throttle(args.host_concurrency, args.rate_limit)
+
+    if args.cache:
+        try:
+            session.cache = PlaylistCache(args.cache, args.cache_size)
+        except Exception as error:
+            print >> sys.stderr, render_date_iso8601(), "Error: opening cache:", args.cache, ">>", error
+            exit(2)
+
+    if getattr(args, 'metrics', None):
+        session.metrics = Metrics()
+
+    return session
+# enddef setup_session()
+
+# Reports the fetches saved by reusing them and the limits of the hosts (in verbose mode) and writes
+# the request timings collected during the run, when --metrics is given
+def report_run(session, args):
+    if session.throttle is not None and getattr(args, 'verbose', False):
+        for line in session.throttle.render_limits():
+            print >> sys.stderr, render_date_iso8601(), "Host limits:", line
+
+    if session.memo is not None:
+        if session.memo.saved > 0 and getattr(args, 'verbose', False):
+            print >> sys.stderr, render_date_iso8601(), "Saved", session.memo.saved, "fetches by reusing playlists already downloaded in this run"
+        if session.metrics is not None:
+            session.metrics.count_saved(session.memo.saved)
+
+    if session.metrics is None:
+        return
+
+    try:
+        session.metrics.write(args.metrics, args.metrics_format)
+    except (IOError, OSError) as error:
+        print >> sys.stderr, render_date_iso8601(), "Error: writing metrics:", args.metrics, ">>", error
+# enddef report_run()
+
+# Yields the URLs to process one at a time, so a list of any size is read in constant memory.
+# Blank lines and lines starting with # are skipped.
+def iter_urls(args):
+    if not args.file:
+        yield args.url
+        return
+
+    if args.file == '-':
+        url_file = sys.stdin
+    elif args.file.endswith('.gz'):
+        url_file = gzip.open(args.file)
+    else:
+        url_file = open(args.file)
+
+    try:
+        for line in url_file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+    finally:
+        if url_file is not sys.stdin:
+            url_file.close()
+# enddef iter_urls()
+
+def verify_url(url):
+    urlcheck = urlparse(url)
+
+    if len(urlcheck.scheme) < 1 or len(urlcheck.netloc) < 1 or len(urlcheck.path) < 1:
+        return False
+
+    return True
+# enddef verify_url()
+
+def render_date_iso8601():
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime())
+    return timestamp
+# enddef render_date_iso8601()
+
+def print_brief(timestamp, out_stream, *items):
+    output = ' '.join(map(str, items))
+    if timestamp:
+        print >> out_stream, render_date_iso8601(), output
+    else:
+        print >> out_stream, output
+# endef print_brief()
+
+def render_status(return_code):
+    if return_code == 0:
+        return "OK:"
+    elif return_code == 1:
+        return "WARNING:"
+
+    return "CRITICAL:"
+# enddef render_status()
+
+# This function sets the return code only if the new code is worse
+def set_return_code(return_code, new_code):
+    return new_code if return_code < new_code else return_code
+# enddef set_return_code
+
+# Loads the master playlist of a URL for the check scripts.
+# Returns None after printing the CRITICAL brief line when the URL can't be checked.
+def load_master(url, timestamp, out_stream, not_variant_msg=">> Does not contain any streams"):
+    if verify_url(url) != True:
+        print_brief(timestamp, out_stream, "CRITICAL: URL=", url, ">> Not a valid URL")
+        return None
+
+    try:
+        master_playlist = fetch.load_master(url)
+    except IOError as error:
+        print_brief(timestamp, out_stream, "CRITICAL: URL=", url, ">>", error)
+        return None
+
+    if not master_playlist.is_variant:
+        print_brief(timestamp, out_stream, "CRITICAL: URL=", url, not_variant_msg)
+        return None
+
+    return master_playlist
+# enddef load_master()
+
+# Runs process_url() over the URLs, using a pool of workers when more than one job is requested.
+# The results are always yielded in the same order as the URLs. Only a few URLs per worker are read
+# ahead of the results, so the URLs can come from a stream of any length.
+def process_urls(process_url, urls, jobs):
+    if jobs < 2:
+        for result in imap(process_url, urls):
+            yield result
+        return
+
+    pool = ThreadPool(jobs)
+    pending = deque()
+    try:
+        for url in urls:
+            pending.append(pool.apply_async(process_url, (url,)))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.close()
+        pool.join()
+# enddef process_urls()
+
+# Writes the result of a check script for one URL and returns its return code
+def write_check_result(result):
+    sys.stdout.write(result[1])
+    return result[0]
+# enddef write_check_result()
+
+# Writes the results of the shard to the --shard-dir, if any
+def save_shard(summary, args):
+    if summary is None:
+        return
+
+    try:
+        summary.save(args.shard_dir)
+    except (IOError, OSError) as error:
+        print >> sys.stderr, render_date_iso8601(), "Error: writing the shard results to", args.shard_dir, ">>", error
+# enddef save_shard()
+
+# Runs process_url() over all the URLs of the run and passes each result to write_result() as soon as it's done.
+# write_result() returns the return code of the URL. Returns the number of URLs processed and the worst return code.
+# When the --deadline is reached the URLs not done yet are left out and the run is at least a WARNING.
+def run_urls(process_url, args, write_result):
+    session = setup_session(args)
+    if args.deadline:
+        session.deadline = time.time() + args.deadline
+    if args.memo_size:
+        session.memo = FetchMemo(args.memo_size * 1024 * 1024)
+    urls = iter_urls(args)
+    result_code = 0
+    count = 0
+
+    source = args.file
+    summary = None
+    if args.shard is not None:
+        from hlstools.shards import ShardSummary, filter_shard
+        urls = filter_shard(urls, *args.shard)
+        source = '%s#shard=%d/%d' % ((args.file,) + args.shard)
+        if args.shard_dir:
+            summary = ShardSummary(args.shard[0], args.shard[1], args.file)
+
+    checkpoint = None
+    if args.checkpoint and args.file:
+        checkpoint = Checkpoint(args.checkpoint, source)
+        count = checkpoint.load()
+        result_code = checkpoint.result_code
+        urls = islice(urls, count, None)
+        # The shard results carry on from the URLs done before too
+        if summary is not None:
+            summary.restore(checkpoint.result_code, checkpoint.codes)
+
+    try:
+        for result in process_urls(process_url, urls, args.jobs):
+            url_code = write_result(result)
+            sys.stdout.flush()
+            result_code = set_return_code(result_code, url_code)
+            count += 1
+            if checkpoint is not None:
+                checkpoint.update(url_code)
+            if summary is not None:
+                summary.update(url_code)
+    except DeadlineExceeded:
+        print >> sys.stderr, render_date_iso8601(), "WARNING: Deadline of", args.deadline, "seconds reached after", count, "URLs, the remaining URLs were not checked"
+        result_code = set_return_code(result_code, 1)
+        # A rerun with the same --checkpoint carries on from here
+        if checkpoint is not None:
+            checkpoint.save()
+        save_shard(summary, args)
+        report_run(session, args)
+        return (count, result_code)
+    except BaseException:
+        if checkpoint is not None:
+            checkpoint.save()
+        save_shard(summary, args)
+        raise
+
+    # The whole list is done, the next run starts from the top again
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    if summary is not None:
+        summary.complete = True
+        save_shard(summary, args)
+
+    report_run(session, args)
+
+    return (count, result_code)
+# enddef run_urls()
@@ -0,0 +1,341 @@
+"""
+Resident check daemon.
+
+A Sensu check starting the scripts pays for the interpreter, the m3u8 import,
+DNS lookups and new connections on every run. The daemon keeps one Session
+for all the checks, so the connection pool, the playlist cache (in memory
+unless --cache is given) and the circuit breaker stay warm between them.
+
+Checks are asked for over HTTP, on a local TCP port or a Unix socket: a POST
+to /check with a JSON list of the hls-check.py arguments, eg.
+["availability", "-t", "http://example.com/master.m3u8"], answered with a
+JSON object of the return code and the stdout and stderr output the script
+would have written. GET /metrics returns the request timings of the Session
+in the Prometheus text format.
+
+With --refresh every check asked for is run again in the background every
+that many seconds, and answered straight from its last result. A check not
+asked for during FORGET_PERIODS refresh periods is dropped.
+"""
+
+import argparse
+import json
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from cStringIO import StringIO
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from SocketServer import TCPServer, ThreadingMixIn
+
+from hlstools import availability, bandwidths, mediastats, watch
+from hlstools.common import add_common_arguments, check_common_arguments, iter_urls, process_urls, render_date_iso8601, set_return_code
+
+# Options of the scripts that only make sense for a run of their own, --file and --ladders would let
+# the clients read any file of the daemon's, and the session options are the daemon's own.
+# They are left out of the --help of the checks.
+UNSUPPORTED_OPTIONS = ('watch', 'watch_duration', 'stall_factor', 'checkpoint', 'deadline', 'metrics', 'metrics_format', 'cache', 'cache_size', 'shard', 'file', 'ladders',
+                       'connect_timeout', 'read_timeout', 'retries', 'retry_backoff', 'breaker_threshold', 'breaker_cooldown',
+                       'memo_size', 'host_concurrency', 'rate_limit')
+
+FORGET_PERIODS = 10
+
+REFRESH_JOBS = 8
+
+MAX_REQUEST_SIZE = 1024 * 1024
+
+class RequestError(Exception):
+
+    def __init__(self, code, stderr, stdout=''):
+        Exception.__init__(self, stderr)
+        self.code = code
+        self.stderr = stderr
+        self.stdout = stdout
+# endclass RequestError
+
+
+class CheckResult(object):
+
+    def __init__(self, code, stdout, stderr):
+        self.code = code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.checked = time.time()
+        self.requested = self.checked
+        self.running = False
+# endclass CheckResult
+
+
+class RequestParser(argparse.ArgumentParser):
+    """
+    ArgumentParser writing what it prints to buffers of the thread parsing the request and raising
+    RequestError instead of exiting, so parsing requests in parallel leaves sys.stdout/sys.stderr alone.
+    The --help and usage meant for stdout stay apart from the errors. The subparsers are RequestParsers too.
+    """
+
+    _output = threading.local()
+
+    def parse_request(self, argv, check_arguments):
+        """
+        Returns the args of argv after check_arguments(args) went through them.
+        """
+        self._output.stdout = StringIO()
+        self._output.stderr = StringIO()
+        try:
+            args = self.parse_args(argv)
+            check_arguments(args)
+        finally:
+            del self._output.stdout, self._output.stderr
+        return args
+    # enddef parse_request()
+
+    def _print_message(self, message, file=None):
+        if message:
+            buffer = self._output.stdout if file is sys.stdout else self._output.stderr
+            buffer.write(message)
+    # enddef _print_message()
+
+    def exit(self, status=0, message=None):
+        self._print_message(message, sys.stderr)
+        raise RequestError(status, self._output.stderr.getvalue(), self._output.stdout.getvalue())
+    # enddef exit()
+# endclass RequestParser
+
+
+def build_parser():
+    parser = RequestParser(prog='hls-check-client.py',
+                           description='Run an HLS check on the hls-check-daemon.py daemon')
+
+    subparsers = parser.add_subparsers(dest='command')
+
+    availability_parser = subparsers.add_parser('availability',
+                                                help='Check all the stream playlists of a master m3u8 playlist are available')
+    add_common_arguments(availability_parser)
+    availability.add_arguments(availability_parser)
+    mediastats.add_arguments(availability_parser)
+    watch.add_arguments(availability_parser)
+
+    bandwidths_parser = subparsers.add_parser('bandwidths',
+                                              help='Check profile bitrates match provided list')
+    bandwidths.add_arguments(bandwidths_parser)
+    add_common_arguments(bandwidths_parser)
+
+    for subparser in (availability_parser, bandwidths_parser):
+        for action in subparser._actions:
+            if action.dest in UNSUPPORTED_OPTIONS:
+                action.help = argparse.SUPPRESS
+
+    return (parser, {'availability': availability_parser, 'bandwidths': bandwidths_parser})
+# enddef build_parser()
+
+
+class CheckDaemon(object):
+
+    def __init__(self, session, refresh=0):
+        self.session = session
+        self.refresh = refresh
+        self.parser, self.subparsers = build_parser()
+        self._results = {}
+        self._results_lock = threading.Lock()
+        self._pool = None
+
+        if refresh:
+            self._pool = ThreadPool(REFRESH_JOBS)
+            thread = threading.Thread(target=self._refresh_loop)
+            thread.daemon = True
+            thread.start()
+
+    def parse(self, argv):
+        """
+        Returns the args of a check command line. Raises RequestError with what the script would
+        have printed and its return code when the arguments are invalid.
+        """
+        return self.parser.parse_request(argv, self._check_arguments)
+    # enddef parse()
+
+    def _check_arguments(self, args):
+        parser = self.subparsers[args.command]
+        for option in UNSUPPORTED_OPTIONS:
+            if getattr(args, option, None) != parser.get_default(option):
+                raise RequestError(2, "Error: --%s can't be used with the daemon\n" % option.replace('_', '-'))
+
+        check_common_arguments(parser, args, 2)
+        if args.command == 'availability':
+            availability.check_arguments(parser, args)
+        else:
+            bandwidths.check_arguments(parser, args)
+    # enddef _check_arguments()
+
+    def run(self, args):
+        """
+        Runs a check like the scripts do. Returns the return code, the stdout and the stderr output.
+        """
+        if args.verbose:
+            args.timestamp = True
+
+        if args.command == 'availability':
+            process_url = partial(availability.check_url, args=args)
+        else:
+            process_url = partial(bandwidths.check_url, args=args, ref_bandwidths=args.ref_bandwidths)
+
+        stdout = StringIO()
+        result_code = 0
+        count = 0
+        for url_code, output in process_urls(process_url, iter_urls(args), args.jobs):
+            stdout.write(output)
+            result_code = set_return_code(result_code, url_code)
+            count += 1
+
+        if count < 1:
+            return (2, stdout.getvalue(), "%s No valid URLs to process.\n" % render_date_iso8601())
+
+        return (result_code, stdout.getvalue(), "")
+    # enddef run()
+
+    def check(self, argv):
+        """
+        Returns the return code, the stdout and the stderr output of a check command line,
+        from its last run when it's refreshed in the background.
+        """
+        key = tuple(argv)
+        if self.refresh:
+            with self._results_lock:
+                result = self._results.get(key)
+                if result is not None and time.time() - result.checked <= self.refresh:
+                    result.requested = time.time()
+                    return (result.code, result.stdout, result.stderr)
+
+        try:
+            code, stdout, stderr = self.run(self.parse(argv))
+        except RequestError as error:
+            return (error.code, error.stdout, error.stderr)
+
+        if self.refresh:
+            with self._results_lock:
+                self._results[key] = CheckResult(code, stdout, stderr)
+
+        return (code, stdout, stderr)
+    # enddef check()
+
+    def _refresh(self, key, result):
+        try:
+            code, stdout, stderr = self.run(self.parse(list(key)))
+        except Exception as error:
+            code, stdout, stderr = (3, "", "%s Error refreshing the check: %s\n" % (render_date_iso8601(), error))
+
+        with self._results_lock:
+            result.code, result.stdout, result.stderr = code, stdout, stderr
+            result.checked = time.time()
+            result.running = False
+    # enddef _refresh()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(min(1.0, self.refresh))
+            now = time.time()
+            with self._results_lock:
+                for key, result in self._results.items():
+                    if now - result.requested > self.refresh * FORGET_PERIODS:
+                        del self._results[key]
+                    elif not result.running and now - result.checked >= self.refresh:
+                        result.running = True
+                        self._pool.apply_async(self._refresh, (key, result))
+    # enddef _refresh_loop()
+# endclass CheckDaemon
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = 4096
+    disable_nagle_algorithm = True
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.send_body(200, 'text/plain; version=0.0.4', self.server.daemon.session.metrics.render_prometheus())
+        else:
+            self.send_body(404, 'text/plain', 'Not found\n')
+    # enddef do_GET()
+
+    def do_POST(self):
+        if self.path != '/check':
+            self.send_body(404, 'text/plain', 'Not found\n')
+            return
+
+        length = int(self.headers.getheader('content-length') or 0)
+        if length > MAX_REQUEST_SIZE:
+            self.send_body(413, 'text/plain', 'Request too large\n')
+            return
+
+        try:
+            argv = json.loads(self.rfile.read(length))
+        except ValueError:
+            argv = None
+        if not isinstance(argv, list) or not all(isinstance(arg, basestring) for arg in argv):
+            self.send_body(400, 'text/plain', 'Expected a JSON list of arguments\n')
+            return
+
+        code, stdout, stderr = self.server.daemon.check([arg.encode('utf-8') for arg in argv])
+        self.send_body(200, 'application/json', json.dumps({'code': code, 'stdout': stdout, 'stderr': stderr}))
+    # enddef do_POST()
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    # enddef send_body()
+# endclass DaemonHandler
+
+
+class UnixDaemonHandler(DaemonHandler):
+
+    # TCP_NODELAY can't be set on a Unix socket
+    disable_nagle_algorithm = False
+# endclass UnixDaemonHandler
+
+
+class DaemonServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 128
+    handler_class = DaemonHandler
+
+    def __init__(self, address, daemon, verbose=False):
+        HTTPServer.__init__(self, address, self.handler_class)
+        self.daemon = daemon
+        self.verbose = verbose
+# endclass DaemonServer
+
+
+class UnixDaemonServer(DaemonServer):
+
+    address_family = socket.AF_UNIX
+    handler_class = UnixDaemonHandler
+
+    def __init__(self, path, daemon, verbose=False):
+        # A socket file left behind by a daemon that didn't stop cleanly, anything else is left for bind() to refuse
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+        DaemonServer.__init__(self, path, daemon, verbose)
+
+    def server_bind(self):
+        # HTTPServer.server_bind() expects a (host, port) address
+        TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+    # enddef server_bind()
+# endclass UnixDaemonServer
@@ -0,0 +1,554 @@
+"""
+Shared HTTP fetch layer for the HLS scripts.
+
+All the playlist downloads go through a Session which keeps a pool of
+persistent (keep-alive) connections per host, asks for gzip transfer encoding
+and hands the text to the m3u8 parser. Errors are raised as urllib2 errors so
+they read the same as the ones m3u8.load() used to raise.
+
+Transient failures (connection errors, timeouts, 429 and 5xx responses) are
+retried with a jittered exponential backoff, and a CircuitBreaker can make
+the requests to a failing host fail fast. Once the deadline of the run has
+passed every request raises DeadlineExceeded, which the checks don't catch.
+
+m3u8 is only imported when a playlist needs the full parser, master playlists
+loaded with load_master() normally go through the faster hlstools.master.
+"""
+
+import errno
+import httplib
+import posixpath
+import random
+import socket
+import threading
+import time
+import urllib2
+import zlib
+from urlparse import urlparse, urljoin
+
+from hlstools.breaker import CircuitOpenError
+from hlstools.master import UnsupportedPlaylist, parse_master
+from hlstools.playlist import summarize, summarize_media
+from hlstools.throttle import parse_retry_after
+
+USER_AGENT = 'hls-tools'
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+RETRY_CODES = (429, 500, 502, 503, 504)
+
+# Size of the reads when a body is downloaded without being kept
+CHUNK_SIZE = 64 * 1024
+
+
+class DeadlineExceeded(Exception):
+    pass
+# endclass DeadlineExceeded
+
+
+class Response(object):
+    """
+    A fully read HTTP response. `url` is the final URL after any redirects.
+    `size` is the number of bytes of the body as sent, `download_time` the seconds
+    from its first to its last byte. The body is None after Session.download() and
+    Session.stream(), which leaves the sink it was fed to in `sink`.
+    """
+
+    def __init__(self, url, status, reason, headers, body, size=None, download_time=None, sink=None):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.size = size
+        self.download_time = download_time
+        self.sink = sink
+
+    def getheader(self, name, default=None):
+        return self.headers.getheader(name, default)
+# endclass Response
+
+
+# Opens conn.sock the same way socket.create_connection() does, timing the DNS lookup and the TCP connect.
+# conn.timeout only applies to the connect, the socket then gets conn.read_timeout.
+def _open_socket(conn):
+    start = time.time()
+    addresses = socket.getaddrinfo(conn.host, conn.port, 0, socket.SOCK_STREAM)
+    resolved = time.time()
+    conn.phase_times['dns'] = resolved - start
+
+    error = socket.error('getaddrinfo returns an empty list')
+    for family, socktype, proto, canonname, address in addresses:
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            if conn.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(conn.timeout)
+            sock.connect(address)
+            if conn.read_timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(conn.read_timeout)
+            conn.sock = sock
+            conn.phase_times['connect'] = time.time() - resolved
+            return
+        except socket.error as error:
+            if sock is not None:
+                sock.close()
+
+    raise error
+# enddef _open_socket()
+
+
+class TimedHTTPConnection(httplib.HTTPConnection):
+    """
+    HTTPConnection recording the DNS and connect times of a new connection in phase_times.
+    """
+
+    def __init__(self, *args, **kwargs):
+        httplib.HTTPConnection.__init__(self, *args, **kwargs)
+        self.read_timeout = self.timeout
+        self.phase_times = {}
+
+    def connect(self):
+        _open_socket(self)
+# endclass TimedHTTPConnection
+
+
+class TimedHTTPSConnection(httplib.HTTPSConnection):
+    """
+    HTTPSConnection recording the DNS, connect and TLS handshake times of a new connection in phase_times.
+    """
+
+    def __init__(self, *args, **kwargs):
+        httplib.HTTPSConnection.__init__(self, *args, **kwargs)
+        self.read_timeout = self.timeout
+        self.phase_times = {}
+
+    def connect(self):
+        _open_socket(self)
+        start = time.time()
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host)
+        self.phase_times['tls'] = time.time() - start
+# endclass TimedHTTPSConnection
+
+
+class Session(object):
+    """
+    Pool of persistent HTTP/HTTPS connections, keyed by scheme and host.
+
+    A Session can be shared between threads, each connection is only handed
+    out to one request at a time. When a PlaylistCache is given, load_master() and
+    load_media() make conditional requests and return the stored summaries on a 304.
+    When a Metrics is given, every request is timed by phase. When a FetchMemo
+    is given, fetches of the same URL are made only once. When a Throttle is given,
+    the requests to each host are held to its adaptive rate and concurrency limits.
+
+    The timeouts are in seconds, None waits forever. `deadline` is the time.time()
+    after which no more requests are made.
+    """
+
+    def __init__(self, max_idle_per_host=16, connect_timeout=None, read_timeout=None, retries=0, retry_backoff=0.5,
+                 breaker=None, deadline=None, cache=None, metrics=None, memo=None, throttle=None):
+        self.max_idle_per_host = max_idle_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker
+        self.deadline = deadline
+        self.cache = cache
+        self.metrics = metrics
+        self.memo = memo
+        self.throttle = throttle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _get_connection(self, scheme, netloc):
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return (idle.pop(), True)
+
+        if scheme == 'https':
+            return (TimedHTTPSConnection(netloc), False)
+
+        return (TimedHTTPConnection(netloc), False)
+    # enddef _get_connection()
+
+    def _release_connection(self, scheme, netloc, conn):
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+
+        conn.close()
+    # enddef _release_connection()
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle = {}
+    # enddef close()
+
+    # Returns the connect and read timeouts for a request, cut down to the time left before the deadline
+    def _get_timeouts(self):
+        if self.deadline is None:
+            return (self.connect_timeout, self.read_timeout)
+
+        remaining = self.deadline - time.time()
+        if remaining <= 0:
+            raise DeadlineExceeded('Run deadline reached')
+
+        return (min(self.connect_timeout or remaining, remaining), min(self.read_timeout or remaining, remaining))
+    # enddef _get_timeouts()
+
+    def _request(self, method, url, headers, max_bytes=None, discard_body=False, sink=None):
+        if self.throttle is None:
+            return self._send(method, url, headers, max_bytes, discard_body, sink)
+
+        host = urlparse(url).netloc
+        if not self.throttle.acquire(host, self.deadline):
+            raise DeadlineExceeded('Run deadline reached')
+
+        response = None
+        failed = False
+        try:
+            response, body = self._send(method, url, headers, max_bytes, discard_body, sink)
+            return (response, body)
+        except CircuitOpenError:
+            raise
+        except urllib2.URLError:
+            failed = True
+            raise
+        finally:
+            if response is not None:
+                self.throttle.release(host, response.status, response.ttfb, parse_retry_after(response.getheader('retry-after')))
+            else:
+                self.throttle.release(host, failed=failed)
+    # enddef _request()
+
+    def _send(self, method, url, headers, max_bytes, discard_body, sink):
+        parsed_url = urlparse(url)
+        path = parsed_url.path or '/'
+        if parsed_url.query:
+            path += '?' + parsed_url.query
+
+        request_headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip'}
+        if headers:
+            request_headers.update(headers)
+
+        if self.breaker is not None:
+            self.breaker.before_request(parsed_url.netloc)
+
+        while True:
+            # Recomputed for every attempt, a retry on a new connection gets what is left before the deadline
+            connect_timeout, read_timeout = self._get_timeouts()
+            conn, reused = self._get_connection(parsed_url.scheme, parsed_url.netloc)
+            conn.timeout = connect_timeout
+            conn.read_timeout = read_timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(read_timeout)
+            conn.phase_times = {}
+            response = None
+            try:
+                start = time.time()
+                conn.request(method, path, headers=request_headers)
+                response = conn.getresponse()
+                first_byte = time.time()
+                response.sink = None
+                if discard_body:
+                    body = None
+                    # Only the body of the playlist itself goes to the sink, not the one of a redirect or an error
+                    if sink is not None and 200 <= response.status < 300:
+                        response.sink = sink()
+                        size = read_into(response, response.sink)
+                    else:
+                        size = read_discarding(response)
+                else:
+                    body = response.read(max_bytes) if max_bytes else response.read()
+                    size = len(body)
+                done = time.time()
+            except (httplib.HTTPException, socket.error) as error:
+                conn.close()
+                # The server may have dropped a pooled connection while it was idle, try again on a new one.
+                # Not once it started answering, nor after a timeout, the request may have reached it.
+                if reused and response is None and is_stale_connection(error):
+                    continue
+                # The timeouts were cut short by the deadline, this isn't a failure of the server
+                if self.deadline is not None and time.time() >= self.deadline:
+                    raise DeadlineExceeded('Run deadline reached')
+                if self.breaker is not None:
+                    self.breaker.record_failure(parsed_url.netloc)
+                raise urllib2.URLError(error)
+
+            # A connection with part of a body still unread can't be used for another request
+            if response.will_close or not response.isclosed():
+                conn.close()
+            else:
+                self._release_connection(parsed_url.scheme, parsed_url.netloc, conn)
+
+            if self.breaker is not None:
+                if response.status >= 500:
+                    self.breaker.record_failure(parsed_url.netloc)
+                else:
+                    self.breaker.record_success(parsed_url.netloc)
+
+            # The time to first byte doesn't include opening the connection
+            response.ttfb = first_byte - start - sum(conn.phase_times.values())
+            response.body_size = size
+            response.download_time = done - first_byte
+
+            if self.metrics is not None:
+                for phase, seconds in conn.phase_times.items():
+                    self.metrics.observe(parsed_url.netloc, phase, seconds)
+                self.metrics.observe(parsed_url.netloc, 'ttfb', response.ttfb)
+                self.metrics.observe(parsed_url.netloc, 'download', response.download_time)
+                self.metrics.count_request(parsed_url.netloc, response.status)
+
+            return (response, body)
+    # enddef _send()
+
+    def fetch(self, url, method='GET', headers=None, max_bytes=None, discard_body=False, sink=None):
+        """
+        Download a URL, following redirects, and return a Response.
+        With max_bytes only the start of the body is read, even if the server ignores a Range header.
+        With discard_body the body is read in chunks and thrown away, see download(), or fed to a sink, see stream().
+        Raises urllib2.HTTPError for 4xx/5xx responses and urllib2.URLError if the request fails,
+        after retrying the transient failures.
+        """
+        if self.memo is not None:
+            key = (method, url, tuple(sorted(headers.items())) if headers else (), max_bytes, discard_body, sink)
+            return self.memo.get(key, lambda: self._fetch_retrying(url, method, headers, max_bytes, discard_body, sink))
+
+        return self._fetch_retrying(url, method, headers, max_bytes, discard_body, sink)
+    # enddef fetch()
+
+    def _fetch_retrying(self, url, method, headers, max_bytes, discard_body, sink=None):
+        for attempt in range(self.retries + 1):
+            try:
+                return self._fetch(url, method, headers, max_bytes, discard_body, sink)
+            except urllib2.URLError as error:
+                if attempt == self.retries or not is_transient(error) or not self._backoff(attempt):
+                    raise
+    # enddef _fetch_retrying()
+
+    def download(self, url, headers=None):
+        """
+        Download a URL in chunks without keeping the body, for segments. The Response has the size
+        and download time of the body, which isn't decompressed. Segments don't go through the memo,
+        which is for the playlists, and a measured download is never answered from it.
+        """
+        download_headers = {'Accept-Encoding': 'identity'}
+        if headers:
+            download_headers.update(headers)
+
+        return self._fetch_retrying(url, 'GET', download_headers, None, True)
+    # enddef download()
+
+    def stream(self, url, sink, headers=None):
+        """
+        Download a URL feeding the body, decompressed, a chunk at a time to a new sink() instead of
+        keeping it, eg. a hlstools.validator.MediaValidator. The sink has feed(data), close() and
+        fail(message) methods and is in the `sink` of the Response. A new one is made for every attempt.
+        """
+        return self.fetch(url, headers=headers, discard_body=True, sink=sink)
+    # enddef stream()
+
+    # Sleeps before the next attempt. Returns False, without sleeping, when it would end after the deadline.
+    def _backoff(self, attempt):
+        delay = self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        if self.deadline is not None and time.time() + delay >= self.deadline:
+            return False
+
+        time.sleep(delay)
+        return True
+    # enddef _backoff()
+
+    def _fetch(self, url, method, headers, max_bytes, discard_body, sink=None):
+        for redirect in range(MAX_REDIRECTS + 1):
+            response, body = self._request(method, url, headers, max_bytes, discard_body, sink)
+            location = response.getheader('location')
+            if response.status not in REDIRECT_CODES or not location:
+                break
+
+            url = urljoin(url, location)
+            if response.status == 303:
+                method = 'GET'
+        else:
+            raise urllib2.URLError('Too many redirects')
+
+        if body and response.getheader('content-encoding', '').lower() == 'gzip':
+            try:
+                # decompressobj() copes with a body cut short by max_bytes
+                body = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(body)
+            except zlib.error as error:
+                raise urllib2.URLError('Invalid gzip body: %s' % error)
+
+        if response.status >= 400:
+            raise urllib2.HTTPError(url, response.status, response.reason, response.msg, None)
+
+        return Response(url, response.status, response.reason, response.msg, body, response.body_size, response.download_time,
+                        response.sink)
+    # enddef _fetch()
+
+    def load_media(self, url):
+        """
+        Download a media playlist and return its MediaSummary: whether it has the #EXTM3U header and its MediaStats.
+        """
+        return self._load(url, False)
+    # enddef load_media()
+
+    def load_master(self, url):
+        """
+        Download and parse a master playlist. Returns a PlaylistSummary from the fast master
+        playlist reader, or an m3u8 object when the playlist needs the full parser.
+        """
+        return self._load(url, True)
+    # enddef load_master()
+
+    def _load(self, url, master):
+        if urlparse(url).scheme not in ('http', 'https'):
+            if not master:
+                return summarize_media(urllib2.urlopen(url).read())
+            import m3u8
+            return m3u8.load(url)
+
+        if self.cache is not None:
+            return self._load_cached(url, master)
+
+        return self._parse(self.fetch(url), master)
+    # enddef _load()
+
+    def _parse(self, response, master):
+        if self.metrics is None:
+            return parse_playlist(response, master)
+
+        start = time.time()
+        playlist = parse_playlist(response, master)
+        self.metrics.observe(urlparse(response.url).netloc, 'parse', time.time() - start)
+        return playlist
+    # enddef _parse()
+
+    def _load_cached(self, url, master):
+        entry = self.cache.get(url)
+        response = self.fetch(url, headers=entry.get_validators() if entry is not None else None)
+
+        if response.status == 304 and entry is not None:
+            self.cache.touch(url)
+            return entry.summary
+
+        summary = summarize(self._parse(response, master))
+
+        etag = response.getheader('etag')
+        last_modified = response.getheader('last-modified')
+        if etag or last_modified:
+            self.cache.put(url, etag, last_modified, summary)
+
+        return summary
+    # enddef _load_cached()
+# endclass Session
+
+
+# Reads the rest of a response a chunk at a time and returns its size
+def read_discarding(response):
+    size = 0
+    while True:
+        chunk = response.read(CHUNK_SIZE)
+        if not chunk:
+            return size
+        size += len(chunk)
+# enddef read_discarding()
+
+# Reads the rest of a response a chunk at a time into a sink, decompressing a gzip body, and returns its size as sent
+def read_into(response, sink):
+    decompressor = None
+    if response.getheader('content-encoding', '').lower() == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    size = 0
+    while True:
+        chunk = response.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+
+        if decompressor is None:
+            sink.feed(chunk)
+            continue
+
+        # Playlists compress very well, so a chunk is inflated a CHUNK_SIZE at a time too
+        try:
+            while chunk:
+                sink.feed(decompressor.decompress(chunk, CHUNK_SIZE))
+                chunk = decompressor.unconsumed_tail
+        except zlib.error as error:
+            # The rest is still read, so the connection can be used again
+            sink.fail('invalid gzip body: %s' % error)
+            return size + read_discarding(response)
+
+    if decompressor is not None:
+        sink.feed(decompressor.flush())
+    sink.close()
+    return size
+# enddef read_into()
+
+# Whether a request failed because the server had closed the idle connection it was sent on:
+# the answer is empty (BadStatusLine) or the connection is reset or broken before any of it
+def is_stale_connection(error):
+    if isinstance(error, httplib.BadStatusLine):
+        return True
+
+    return isinstance(error, socket.error) and not isinstance(error, socket.timeout) and \
+        error.errno in (errno.ECONNRESET, errno.EPIPE)
+# enddef is_stale_connection()
+
+# Connection errors, timeouts and overloaded servers are worth another try
+def is_transient(error):
+    if isinstance(error, urllib2.HTTPError):
+        return error.code in RETRY_CODES
+
+    return isinstance(error.reason, socket.error)
+# enddef is_transient()
+
+# Same base URI m3u8.load() uses, ie. the "directory" of the playlist URL
+def get_base_uri(url):
+    parsed_url = urlparse(url)
+    prefix = parsed_url.scheme + '://' + parsed_url.netloc
+    base_path = posixpath.normpath(parsed_url.path + '/..')
+    return urljoin(prefix, base_path)
+# enddef get_base_uri()
+
+def parse_playlist(response, master=False):
+    if not master:
+        return summarize_media(response.body)
+
+    base_uri = get_base_uri(response.url)
+    try:
+        return parse_master(response.body, base_uri)
+    except UnsupportedPlaylist:
+        pass
+
+    import m3u8
+    return m3u8.M3U8(response.body.strip(), base_uri=base_uri)
+# enddef parse_playlist()
+
+_session = None
+_session_lock = threading.Lock()
+
+# Returns the Session shared by the whole run
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = Session()
+        return _session
+# enddef get_session()
+
+def load_media(url):
+    return get_session().load_media(url)
+# enddef load_media()
+
+def load_master(url):
+    return get_session().load_master(url)
+# enddef load_master()
@@ -0,0 +1,178 @@
+"""
+Profile history: the ladder of every master playlist over time, in SQLite.
+
+A snapshot of the renditions of a URL (uri, bandwidth, average bandwidth,
+resolution and codecs) is only written when it differs from the last one
+stored for that URL, so the file grows with the ladder changes rather than
+with the runs. The snapshots are indexed by URL and time: the last snapshot
+of a URL, or its history over a time range, is a single index lookup.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+Rendition = namedtuple('Rendition', ['uri', 'bandwidth', 'average_bandwidth', 'resolution', 'codecs'])
+
+Snapshot = namedtuple('Snapshot', ['url', 'timestamp', 'seen', 'renditions'])
+
+# New snapshots are committed in batches, a commit per snapshot makes the first run over a long list crawl.
+# With commit_each (--checkpoint) every snapshot is committed, a resumed run skips the URLs it has done.
+COMMIT_EVERY = 100
+
+# Formats accepted by --since and --until, in local time
+TIME_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d')
+
+# Returns the seconds since the epoch of a YYYY-MM-DD[THH:MM[:SS]] local time, raises ValueError if it isn't one
+def parse_time(value):
+    for time_format in TIME_FORMATS:
+        try:
+            return time.mktime(time.strptime(value, time_format))
+        except ValueError:
+            pass
+
+    raise ValueError('Invalid time: %s, expected YYYY-MM-DD[THH:MM[:SS]]' % value)
+# enddef parse_time()
+
+def get_renditions(playlists):
+    renditions = []
+    for playlist in playlists:
+        stream_info = playlist.stream_info
+        resolution = 'x'.join(str(value) for value in stream_info.resolution) if stream_info.resolution else None
+        renditions.append(Rendition(playlist.uri, stream_info.bandwidth, stream_info.average_bandwidth,
+                                    resolution, stream_info.codecs))
+
+    return renditions
+# enddef get_renditions()
+
+def render_rendition(rendition):
+    fields = [rendition.uri, str(rendition.bandwidth)]
+    if rendition.resolution:
+        fields.append(rendition.resolution)
+    if rendition.codecs:
+        fields.append('"%s"' % rendition.codecs)
+
+    return ' '.join(fields)
+# enddef render_rendition()
+
+# Returns the (key, rendition) pairs of a ladder, the key is the URI with a #2, #3, ... suffix for a URI listed more than once
+def key_renditions(renditions):
+    counts = {}
+    keyed = []
+    for rendition in renditions:
+        count = counts[rendition.uri] = counts.get(rendition.uri, 0) + 1
+        keyed.append((rendition.uri if count == 1 else '%s#%d' % (rendition.uri, count), rendition))
+
+    return keyed
+# enddef key_renditions()
+
+# Returns the differences between two ladders as a list of messages, empty when they're the same
+def diff_ladders(old, new):
+    old_keyed = key_renditions(old)
+    new_keyed = key_renditions(new)
+    old_index = dict(old_keyed)
+    new_index = dict(new_keyed)
+    changes = []
+
+    for key, rendition in new_keyed:
+        previous = old_index.get(key)
+        if previous is None:
+            changes.append('added %s' % render_rendition(rendition))
+            continue
+
+        for field in Rendition._fields[1:]:
+            if getattr(previous, field) != getattr(rendition, field):
+                changes.append('changed %s %s %s -> %s' % (key, field, getattr(previous, field), getattr(rendition, field)))
+
+    for key, rendition in old_keyed:
+        if key not in new_index:
+            changes.append('removed %s' % render_rendition(rendition))
+
+    if not changes and old != new:
+        changes.append('reordered %s' % ' '.join(rendition.uri for rendition in new))
+
+    return changes
+# enddef diff_ladders()
+
+
+class ProfileHistory(object):
+
+    def __init__(self, filename, commit_each=False):
+        self.filename = filename
+        self.commit_each = commit_each
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS snapshots ('
+                         'id INTEGER PRIMARY KEY, url TEXT NOT NULL, timestamp TEXT, seen REAL NOT NULL, renditions TEXT)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS snapshots_url_seen ON snapshots (url, seen)')
+        self._db.commit()
+        self._pending = 0
+
+    def _make_snapshot(self, row):
+        return Snapshot(row[0], row[1], row[2], [Rendition._make(rendition) for rendition in json.loads(row[3])])
+    # enddef _make_snapshot()
+
+    def last(self, url, before=None):
+        """
+        Returns the last Snapshot of a URL (taken before a time), or None if there isn't one.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT url, timestamp, seen, renditions FROM snapshots WHERE url = ? AND seen < ? '
+                                   'ORDER BY seen DESC LIMIT 1', (url, before if before is not None else float('inf'))).fetchone()
+
+        return self._make_snapshot(row) if row is not None else None
+    # enddef last()
+
+    def record(self, url, timestamp, playlists):
+        """
+        Stores the ladder of a URL when it changed. Returns the previous Snapshot (None for a new URL)
+        and the list of changes since then.
+        """
+        renditions = get_renditions(playlists)
+        previous = self.last(url)
+        if previous is not None:
+            changes = diff_ladders(previous.renditions, renditions)
+            if not changes:
+                return (previous, changes)
+        else:
+            changes = []
+
+        with self._lock:
+            self._db.execute('INSERT INTO snapshots (url, timestamp, seen, renditions) VALUES (?, ?, ?, ?)',
+                             (url, timestamp, time.time(), json.dumps(renditions)))
+            self._pending += 1
+            if self.commit_each or self._pending >= COMMIT_EVERY:
+                self._db.commit()
+                self._pending = 0
+
+        return (previous, changes)
+    # enddef record()
+
+    def query(self, url, since=None, until=None):
+        """
+        Returns the Snapshots of a URL taken between two times, oldest first, after the last one
+        taken before `since` (the ladder at that time), if any.
+        """
+        snapshots = []
+        if since is not None:
+            before = self.last(url, since)
+            if before is not None:
+                snapshots.append(before)
+
+        with self._lock:
+            rows = self._db.execute('SELECT url, timestamp, seen, renditions FROM snapshots WHERE url = ? AND seen >= ? AND seen <= ? '
+                                    'ORDER BY seen', (url, since if since is not None else float('-inf'),
+                                                      until if until is not None else float('inf'))).fetchall()
+
+        snapshots.extend(self._make_snapshot(row) for row in rows)
+        return snapshots
+    # enddef query()
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+    # enddef close()
+# endclass ProfileHistory
@@ -0,0 +1,132 @@
+"""
+Expected bandwidth ladders per URL, for checking a whole inventory in one run.
+
+A ladder file is a JSON list of entries, each matching URLs by exact `host`,
+shell-style `pattern` or `regex`, with the expected `bandwidths` and optionally
+`unordered` and `variance_percent`:
+
+    [
+        {"pattern": "*/bipbop_4x3/*", "bandwidths": "232370 649879 991714 1927833 41457", "variance_percent": 1},
+        {"host": "localhost:8000", "bandwidths": [232370, 649879, 991714, 1927833, 41457], "unordered": true}
+    ]
+
+The patterns and regexes are tried in file order (first match wins), then the
+host entries are looked up in a dict. A pattern matches the whole URL, a regex
+is searched for anywhere in it (anchor it with ^ to match from the start).
+Consecutive patterns are compiled into a few combined regexes, each regex on
+its own so its groups and backreferences stay as written. Options missing
+from an entry come from the command-line.
+"""
+
+import fnmatch
+import json
+import re
+from urlparse import urlparse
+
+from hlstools.bandwidths import get_variance_ladder
+
+# Python 2 regexes can't have more than 100 named groups
+PATTERNS_PER_REGEX = 90
+
+class LadderError(ValueError):
+    pass
+# endclass LadderError
+
+class LadderProfile(object):
+
+    def __init__(self, name, ref_bandwidths, unordered, variance_percent):
+        self.name = name
+        self.ref_bandwidths = ref_bandwidths
+        self.unordered = unordered
+        self.variance_percent = variance_percent
+# endclass LadderProfile
+
+
+class LadderProfiles(object):
+
+    def __init__(self, entries, unordered=False, variance_percent=None):
+        self._hosts = {}
+        # (match function, profiles by group or None, profile) in file order
+        self._matchers = []
+
+        patterns = []
+        for idx, entry in enumerate(entries):
+            profile = make_profile(idx, entry, unordered, variance_percent)
+
+            if 'host' in entry:
+                self._hosts.setdefault(entry['host'].lower(), profile)
+            elif 'pattern' in entry:
+                patterns.append((fnmatch.translate(entry['pattern']), profile))
+            elif 'regex' in entry:
+                try:
+                    regex = re.compile(entry['regex'])
+                except (re.error, AssertionError) as error:
+                    # Python 2 asserts there are no more than 100 groups
+                    raise LadderError('Invalid regex in ladder entry %d: %s' % (idx + 1, error))
+                self._add_patterns(patterns)
+                patterns = []
+                self._matchers.append((regex.search, None, profile))
+            else:
+                raise LadderError('Ladder entry %d has no host, pattern or regex' % (idx + 1))
+
+        self._add_patterns(patterns)
+
+    # One alternation per chunk of shell-style patterns, the group that matched tells which profile it was
+    def _add_patterns(self, patterns):
+        for start in range(0, len(patterns), PATTERNS_PER_REGEX):
+            chunk = patterns[start:start + PATTERNS_PER_REGEX]
+            regex = re.compile('|'.join('(?P<p%d>%s)' % (idx, pattern) for idx, (pattern, profile) in enumerate(chunk)))
+            self._matchers.append((regex.match, [profile for pattern, profile in chunk], None))
+    # enddef _add_patterns()
+
+    def lookup(self, url):
+        """
+        Returns the LadderProfile for a URL, or None if no entry matches it.
+        """
+        for match_url, profiles, profile in self._matchers:
+            match = match_url(url)
+            if match is not None:
+                return profiles[int(match.lastgroup[1:])] if profiles is not None else profile
+
+        return self._hosts.get(urlparse(url).netloc.lower())
+    # enddef lookup()
+# endclass LadderProfiles
+
+
+def make_profile(idx, entry, unordered, variance_percent):
+    bandwidths = entry.get('bandwidths')
+    if isinstance(bandwidths, basestring):
+        bandwidths = bandwidths.split()
+
+    if not bandwidths:
+        raise LadderError('Ladder entry %d has no bandwidths' % (idx + 1))
+
+    ref_bandwidths = [str(bandwidth) for bandwidth in bandwidths]
+    for bandwidth in ref_bandwidths:
+        if not bandwidth.isdigit():
+            raise LadderError('Invalid bandwidth value in ladder entry %d: %s is not an integer' % (idx + 1, bandwidth))
+
+    profile = LadderProfile(entry.get('host') or entry.get('pattern') or entry.get('regex'),
+                            ref_bandwidths,
+                            entry.get('unordered', unordered),
+                            entry.get('variance_percent', variance_percent))
+
+    # Compile the variance ranges now rather than on the first URL using them
+    if profile.variance_percent:
+        get_variance_ladder(profile.ref_bandwidths, float(profile.variance_percent))
+
+    return profile
+# enddef make_profile()
+
+def load_ladders(filename, unordered=False, variance_percent=None):
+    try:
+        with open(filename) as ladder_file:
+            entries = json.load(ladder_file)
+    except (IOError, ValueError) as error:
+        raise LadderError('Error reading ladder file %s: %s' % (filename, error))
+
+    if not isinstance(entries, list):
+        raise LadderError('Ladder file %s must contain a list of entries' % filename)
+
+    return LadderProfiles(entries, unordered, variance_percent)
+# enddef load_ladders()
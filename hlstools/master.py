@@ -0,0 +1,136 @@
+"""
+Fast reader for master playlists.
+
+The scripts only need the #EXT-X-STREAM-INF attributes and URIs of a master
+playlist, and the URIs of its #EXT-X-MEDIA renditions and I-frame playlists,
+so this reads just those in a single pass over the lines, without
+importing m3u8 (and iso8601) or building its object model. Anything it
+doesn't know about raises UnsupportedPlaylist so the caller can fall back to
+the full m3u8 parser.
+"""
+
+import re
+
+from hlstools.playlist import IFramePlaylist, Media, PlaylistSummary, StreamInfo, Variant
+
+# Splits an attribute list on the commas outside of quoted strings, eg. CODECS="mp4a.40.2, avc1.4d4015"
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^",]*)')
+
+# Tags of a master playlist that don't change the list of variant streams
+MASTER_TAGS = frozenset([
+    '#EXTM3U',
+    '#EXT-X-VERSION',
+    '#EXT-X-INDEPENDENT-SEGMENTS',
+    '#EXT-X-START',
+    '#EXT-X-MEDIA',
+    '#EXT-X-I-FRAME-STREAM-INF',
+    '#EXT-X-SESSION-DATA',
+    '#EXT-X-SESSION-KEY',
+])
+
+# Tags only found in media playlists
+MEDIA_TAGS = frozenset([
+    '#EXTINF',
+    '#EXT-X-TARGETDURATION',
+    '#EXT-X-MEDIA-SEQUENCE',
+    '#EXT-X-DISCONTINUITY-SEQUENCE',
+    '#EXT-X-PLAYLIST-TYPE',
+    '#EXT-X-ENDLIST',
+    '#EXT-X-I-FRAMES-ONLY',
+])
+
+class UnsupportedPlaylist(ValueError):
+    pass
+# endclass UnsupportedPlaylist
+
+def parse_attributes(attribute_list):
+    attributes = {}
+    for name, value in ATTRIBUTE_PATTERN.findall(attribute_list):
+        if value[:1] == '"':
+            value = value[1:-1]
+        attributes[name] = value
+
+    return attributes
+# enddef parse_attributes()
+
+# Same values as m3u8's stream_info: integer bandwidths and a (width, height) tuple for the resolution
+def parse_stream_info(attribute_list, tag='#EXT-X-STREAM-INF'):
+    attributes = parse_attributes(attribute_list)
+
+    try:
+        resolution = attributes.get('RESOLUTION')
+        if resolution is not None:
+            width, height = resolution.split('x')
+            resolution = (int(width), int(height))
+
+        average_bandwidth = attributes.get('AVERAGE-BANDWIDTH')
+        program_id = attributes.get('PROGRAM-ID')
+
+        return StreamInfo(int(attributes['BANDWIDTH']),
+                          resolution,
+                          attributes.get('CODECS'),
+                          int(program_id) if program_id is not None else None,
+                          int(average_bandwidth) if average_bandwidth is not None else None)
+    except (KeyError, ValueError):
+        raise UnsupportedPlaylist('Invalid %s:%s' % (tag, attribute_list))
+# enddef parse_stream_info()
+
+# Same values as m3u8's media, which keeps the URI as it is
+def parse_media(attribute_list):
+    attributes = parse_attributes(attribute_list)
+    if 'TYPE' not in attributes:
+        raise UnsupportedPlaylist('Invalid #EXT-X-MEDIA:' + attribute_list)
+
+    return Media(attributes.get('URI'), attributes['TYPE'], attributes.get('GROUP-ID'), attributes.get('LANGUAGE'),
+                 attributes.get('NAME'))
+# enddef parse_media()
+
+def parse_iframe_playlist(attribute_list):
+    uri = parse_attributes(attribute_list).get('URI')
+    if uri is None:
+        raise UnsupportedPlaylist('Invalid #EXT-X-I-FRAME-STREAM-INF:' + attribute_list)
+
+    return IFramePlaylist(uri, parse_stream_info(attribute_list, '#EXT-X-I-FRAME-STREAM-INF'))
+# enddef parse_iframe_playlist()
+
+# Returns a PlaylistSummary of a master playlist. A media playlist gives a summary with is_variant False, like m3u8.
+# Raises UnsupportedPlaylist when the full m3u8 parser is needed.
+def parse_master(content, base_uri):
+    if base_uri and not base_uri.endswith('/'):
+        base_uri += '/'
+
+    playlists = []
+    media = []
+    iframe_playlists = []
+    stream_info = None
+
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        if line[0] == '#':
+            if not line.startswith('#EXT'):
+                continue    # comment
+
+            tag, _, attribute_list = line.partition(':')
+            if tag == '#EXT-X-STREAM-INF':
+                stream_info = parse_stream_info(attribute_list)
+            elif tag == '#EXT-X-MEDIA':
+                media.append(parse_media(attribute_list))
+            elif tag == '#EXT-X-I-FRAME-STREAM-INF':
+                iframe_playlists.append(parse_iframe_playlist(attribute_list))
+            elif tag in MEDIA_TAGS:
+                break
+            elif tag not in MASTER_TAGS:
+                raise UnsupportedPlaylist('Unsupported tag ' + tag)
+            continue
+
+        if stream_info is None:
+            raise UnsupportedPlaylist('URI without #EXT-X-STREAM-INF: ' + line)
+
+        playlists.append(Variant(line, stream_info))
+        stream_info = None
+
+    return PlaylistSummary(len(playlists) > 0, base_uri, playlists, media, iframe_playlists)
+# enddef parse_master()
@@ -0,0 +1,73 @@
+"""
+Statistics of a media playlist, without building an m3u8 object per segment.
+
+The #EXTINF durations are read straight into an array('d') of doubles and
+the stats are computed over it with the built-in functions, which loop in C.
+The tags are counted with plain substring searches. A DVR playlist of 100k
+segments is read in tens of milliseconds into under 1MB of durations,
+instead of the hundreds of MB and seconds the m3u8 parser needs for it.
+"""
+
+import re
+from array import array
+from collections import namedtuple
+from itertools import imap
+
+# Without a ^ anchor the regex engine can skip ahead to the literal prefix, which is a lot faster
+EXTINF_PATTERN = re.compile(r'#EXTINF:[ \t]*([0-9.]+)')
+TARGET_DURATION_PATTERN = re.compile(r'^#EXT-X-TARGETDURATION:[ \t]*([0-9]+)', re.M)
+MEDIA_SEQUENCE_PATTERN = re.compile(r'^#EXT-X-MEDIA-SEQUENCE:[ \t]*([0-9]+)', re.M)
+
+MediaStats = namedtuple('MediaStats', ['segments', 'total_duration', 'min_duration', 'max_duration', 'mean_duration',
+                                       'target_duration', 'target_violations', 'discontinuities', 'media_sequence', 'ended'])
+
+def add_arguments(parser):
+    parser.add_argument('--media-stats',
+                        action='store_true',
+                        default=False,
+                        help='Also read the segment count, durations and discontinuities of each stream playlist. The availability check warns about segments longer than #EXT-X-TARGETDURATION (with --probe full or validate), the profiles get segments:duration:min:max:mean:over_target:discontinuities per stream')
+# enddef add_arguments()
+
+# Returns the #EXTINF durations of a media playlist as an array of doubles
+def load_durations(content):
+    return array('d', map(float, EXTINF_PATTERN.findall(content)))
+# enddef load_durations()
+
+def analyze_media(content):
+    durations = load_durations(content)
+
+    match = TARGET_DURATION_PATTERN.search(content)
+    target_duration = int(match.group(1)) if match else None
+
+    match = MEDIA_SEQUENCE_PATTERN.search(content)
+    media_sequence = int(match.group(1)) if match else 0
+
+    target_violations = 0
+    if target_duration is not None:
+        # A segment is too long when its duration rounded to the nearest integer is over the target
+        target_violations = sum(imap((target_duration + 0.5).__le__, durations))
+
+    total_duration = sum(durations)
+    count = len(durations)
+
+    return MediaStats(count,
+                      total_duration,
+                      min(durations) if count else None,
+                      max(durations) if count else None,
+                      total_duration / count if count else None,
+                      target_duration,
+                      target_violations,
+                      content.count('\n#EXT-X-DISCONTINUITY') - content.count('\n#EXT-X-DISCONTINUITY-SEQUENCE'),
+                      media_sequence,
+                      '\n#EXT-X-ENDLIST' in content)
+# enddef analyze_media()
+
+# One line summary of the stats, for the check output
+def render_stats(stats):
+    if stats.segments < 1:
+        return "0 segments"
+
+    return "%d segments, %.3fs (min %.3fs, max %.3fs, mean %.3fs), %d over TARGETDURATION, %d discontinuities" % (
+        stats.segments, stats.total_duration, stats.min_duration, stats.max_duration, stats.mean_duration,
+        stats.target_violations, stats.discontinuities)
+# enddef render_stats()
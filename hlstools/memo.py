@@ -0,0 +1,106 @@
+"""
+Run-wide memo of the Session fetches.
+
+Masters often share their variant playlists (eg. regional masters pointing at
+one origin ladder) and URL lists have duplicates. During a run every fetch
+is keyed by its absolute URL (and method, headers and how much of the body
+is read): a fetch already in flight for the same key is waited for instead
+of being made again, and a finished one is answered from memory for the rest
+of the run. Failed fetches (URLError/HTTPError) are reused too, so a broken
+URL isn't retried for every master pointing at it.
+
+The bodies are kept up to max_bytes, the least recently used are dropped
+past that. `saved` counts the fetches that didn't have to be made.
+"""
+
+import threading
+import urllib2
+from collections import OrderedDict
+
+DEFAULT_MAX_MB = 64
+
+# Counted for every entry on top of its body, so failures and discarded bodies aren't free
+ENTRY_OVERHEAD = 1024
+
+class Flight(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+        return self.response
+    # enddef get()
+# endclass Flight
+
+
+class FetchMemo(object):
+
+    def __init__(self, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.saved = 0
+        self._done = OrderedDict()
+        self._in_flight = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch):
+        """
+        Returns the Response of a fetch, calling fetch() only if the key isn't done or in flight.
+        """
+        with self._lock:
+            flight = self._done.pop(key, None)
+            if flight is not None:
+                # Most recently used last
+                self._done[key] = flight
+                self.saved += 1
+                return flight.get()
+
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = Flight()
+            else:
+                self.saved += 1
+
+        if not leader:
+            flight.event.wait()
+            return flight.get()
+
+        keep = True
+        try:
+            flight.response = fetch()
+        except urllib2.URLError as error:
+            flight.error = error
+        except BaseException as error:
+            # Eg. the run deadline, which isn't an answer for the rest of the run
+            flight.error = error
+            keep = False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if keep:
+                    self._store(key, flight)
+            flight.event.set()
+
+        return flight.get()
+    # enddef get()
+
+    def _store(self, key, flight):
+        self._done[key] = flight
+        self._size += get_size(flight)
+        while self._size > self.max_bytes and self._done:
+            self._size -= get_size(self._done.popitem(last=False)[1])
+    # enddef _store()
+# endclass FetchMemo
+
+
+def get_size(flight):
+    if flight.response is None or flight.response.body is None:
+        return ENTRY_OVERHEAD
+
+    return ENTRY_OVERHEAD + len(flight.response.body)
+# enddef get_size()
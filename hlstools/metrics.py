@@ -0,0 +1,157 @@
+"""
+Timing of the playlist requests, by host and phase.
+
+When enabled, the Session records how long each request spent in DNS, TCP
+connect, TLS handshake, waiting for the first byte, downloading the body and
+parsing the playlist. The times are kept in per-host histograms which can be
+written as Sensu (Graphite plaintext) metric lines or a Prometheus text file.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+
+METRIC_FORMATS = ('sensu', 'prometheus')
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+SENSU_PREFIX = 'hls_tools'
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def observe(self, value):
+        for idx, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[idx] += 1
+                break
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+    # enddef observe()
+
+    # Estimates a quantile from the buckets, interpolating inside the bucket it falls in
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        lower = self.min
+        for bound, count in zip(BUCKETS, self.counts):
+            if count and seen + count >= rank:
+                lower = max(lower, self.min)
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+
+        return self.max
+    # enddef quantile()
+# endclass Histogram
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self._histograms = {}
+        self._requests = {}
+        self._saved = None
+        self._lock = threading.Lock()
+
+    def observe(self, host, phase, seconds):
+        with self._lock:
+            histogram = self._histograms.get((host, phase))
+            if histogram is None:
+                histogram = self._histograms[(host, phase)] = Histogram()
+            histogram.observe(seconds)
+    # enddef observe()
+
+    def count_request(self, host, status):
+        with self._lock:
+            self._requests[(host, status)] = self._requests.get((host, status), 0) + 1
+    # enddef count_request()
+
+    # Number of fetches the run didn't have to make, see hlstools.memo
+    def count_saved(self, count):
+        with self._lock:
+            self._saved = (self._saved or 0) + count
+    # enddef count_saved()
+
+    def render_sensu(self, timestamp=None):
+        timestamp = int(timestamp or time.time())
+        lines = []
+        with self._lock:
+            for (host, phase), histogram in sorted(self._histograms.items()):
+                path = '%s.%s.%s' % (SENSU_PREFIX, sanitize_host(host), phase)
+                lines.append('%s.count %d %d' % (path, histogram.count, timestamp))
+                lines.append('%s.mean %.6f %d' % (path, histogram.sum / histogram.count, timestamp))
+                for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+                    lines.append('%s.%s %.6f %d' % (path, name, histogram.quantile(q), timestamp))
+                lines.append('%s.max %.6f %d' % (path, histogram.max, timestamp))
+            for (host, status), count in sorted(self._requests.items()):
+                lines.append('%s.%s.requests.%s %d %d' % (SENSU_PREFIX, sanitize_host(host), status, count, timestamp))
+            if self._saved is not None:
+                lines.append('%s.fetches_saved %d %d' % (SENSU_PREFIX, self._saved, timestamp))
+
+        return '\n'.join(lines) + '\n' if lines else ''
+    # enddef render_sensu()
+
+    def render_prometheus(self):
+        lines = ['# HELP hls_request_phase_seconds Time spent in each phase of the playlist requests',
+                 '# TYPE hls_request_phase_seconds histogram']
+        with self._lock:
+            for (host, phase), histogram in sorted(self._histograms.items()):
+                labels = 'host="%s",phase="%s"' % (host, phase)
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append('hls_request_phase_seconds_bucket{%s,le="%s"} %d' % (labels, '+Inf' if bound == float('inf') else repr(bound), cumulative))
+                lines.append('hls_request_phase_seconds_sum{%s} %.6f' % (labels, histogram.sum))
+                lines.append('hls_request_phase_seconds_count{%s} %d' % (labels, histogram.count))
+
+            lines.append('# HELP hls_requests_total Playlist requests by response status')
+            lines.append('# TYPE hls_requests_total counter')
+            for (host, status), count in sorted(self._requests.items()):
+                lines.append('hls_requests_total{host="%s",status="%s"} %d' % (host, status, count))
+
+            if self._saved is not None:
+                lines.append('# HELP hls_fetches_saved_total Fetches answered by a fetch in flight or done earlier in the run')
+                lines.append('# TYPE hls_fetches_saved_total counter')
+                lines.append('hls_fetches_saved_total %d' % self._saved)
+
+        return '\n'.join(lines) + '\n'
+    # enddef render_prometheus()
+
+    def write(self, filename, metrics_format):
+        output = self.render_prometheus() if metrics_format == 'prometheus' else self.render_sensu()
+
+        if filename == '-':
+            sys.stdout.write(output)
+            return
+
+        # The Prometheus textfile collector may read the file at any time, so replace it in one go
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as metrics_file:
+            metrics_file.write(output)
+        os.rename(tmp_filename, filename)
+    # enddef write()
+# endclass Metrics
+
+
+def sanitize_host(host):
+    return re.sub(r'[^A-Za-z0-9_-]', '_', host)
+# enddef sanitize_host()
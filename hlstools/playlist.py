@@ -0,0 +1,122 @@
+"""
+Lightweight summaries of parsed playlists.
+
+A summary only keeps what the checks use from an m3u8 object (is_variant,
+base_uri, the uri/stream_info of each variant playlist, the #EXT-X-MEDIA
+renditions and the I-frame playlists) with the same attribute names, so it
+can be used in place of the full object and stored as JSON. A media playlist
+is summed up by whether it has the #EXTM3U header and its MediaStats.
+"""
+
+from collections import namedtuple
+
+from hlstools.mediastats import MediaStats, analyze_media
+
+StreamInfo = namedtuple('StreamInfo', ['bandwidth', 'resolution', 'codecs', 'program_id', 'average_bandwidth'])
+
+Variant = namedtuple('Variant', ['uri', 'stream_info'])
+
+Media = namedtuple('Media', ['uri', 'type', 'group_id', 'language', 'name'])
+
+IFramePlaylist = namedtuple('IFramePlaylist', ['uri', 'iframe_stream_info'])
+
+PlaylistSummary = namedtuple('PlaylistSummary', ['is_variant', 'base_uri', 'playlists', 'media', 'iframe_playlists'])
+
+MediaSummary = namedtuple('MediaSummary', ['has_header', 'stats'])
+
+# #EXT-X-MEDIA types with a playlist of their own, CLOSED-CAPTIONS are carried in the video
+RENDITION_TYPES = ('AUDIO', 'VIDEO', 'SUBTITLES')
+
+IFRAME_TYPE = 'I-FRAME'
+
+def make_stream_info(stream_info):
+    return StreamInfo(stream_info.bandwidth, stream_info.resolution, stream_info.codecs, stream_info.program_id,
+                      getattr(stream_info, 'average_bandwidth', None))
+# enddef make_stream_info()
+
+# Whether a playlist starts with the #EXTM3U header, even after a BOM or blank lines
+def has_header(content):
+    return content.lstrip('\xef\xbb\xbf \t\r\n').startswith('#EXTM3U')
+# enddef has_header()
+
+def summarize_media(content):
+    return MediaSummary(has_header(content), analyze_media(content))
+# enddef summarize_media()
+
+def summarize(m3u8_obj):
+    if isinstance(m3u8_obj, (PlaylistSummary, MediaSummary)):
+        return m3u8_obj
+
+    playlists = [Variant(playlist.uri, make_stream_info(playlist.stream_info)) for playlist in m3u8_obj.playlists]
+    media = [Media(media.uri, media.type, media.group_id, media.language, media.name) for media in m3u8_obj.media]
+    iframe_playlists = [IFramePlaylist(playlist.uri, make_stream_info(playlist.iframe_stream_info))
+                        for playlist in m3u8_obj.iframe_playlists]
+
+    return PlaylistSummary(m3u8_obj.is_variant, m3u8_obj.base_uri, playlists, media, iframe_playlists)
+# enddef summarize()
+
+def get_rendition_groups(master_playlist):
+    """
+    Returns the playlists a master refers to besides its variant streams (the #EXT-X-MEDIA renditions
+    and the I-frame playlists) as a (type, URIs) tuple per type, without duplicates. Works on
+    summaries and m3u8 objects.
+    """
+    groups = []
+    for rendition_type in RENDITION_TYPES:
+        uris = [media.uri for media in master_playlist.media if media.type == rendition_type and media.uri]
+        if uris:
+            groups.append((rendition_type, unique(uris)))
+
+    uris = [playlist.uri for playlist in master_playlist.iframe_playlists]
+    if uris:
+        groups.append((IFRAME_TYPE, unique(uris)))
+
+    return groups
+# enddef get_rendition_groups()
+
+# The items of a list in the same order, without the repeated ones
+def unique(items):
+    seen = set()
+    result = []
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            result.append(item)
+
+    return result
+# enddef unique()
+
+def summary_to_dict(summary):
+    if isinstance(summary, MediaSummary):
+        return {'has_header': summary.has_header, 'media_stats': list(summary.stats)}
+
+    return {
+        'is_variant': summary.is_variant,
+        'base_uri': summary.base_uri,
+        'playlists': [[variant.uri, list(variant.stream_info)] for variant in summary.playlists],
+        'media': [list(media) for media in summary.media],
+        'iframe_playlists': [[playlist.uri, list(playlist.iframe_stream_info)] for playlist in summary.iframe_playlists],
+    }
+# enddef summary_to_dict()
+
+def stream_info_from_list(stream_info):
+    # Entries written before a field was added are padded with None
+    stream_info = StreamInfo._make(stream_info + [None] * (len(StreamInfo._fields) - len(stream_info)))
+    # JSON turns the (width, height) tuple into a list
+    if stream_info.resolution is not None:
+        stream_info = stream_info._replace(resolution=tuple(stream_info.resolution))
+
+    return stream_info
+# enddef stream_info_from_list()
+
+# Raises KeyError for a summary stored before the renditions were kept, which can't be padded
+def summary_from_dict(data):
+    if 'media_stats' in data:
+        return MediaSummary(data['has_header'], MediaStats._make(data['media_stats']))
+
+    playlists = [Variant(uri, stream_info_from_list(stream_info)) for uri, stream_info in data['playlists']]
+    media = [Media._make(media) for media in data['media']]
+    iframe_playlists = [IFramePlaylist(uri, stream_info_from_list(stream_info)) for uri, stream_info in data['iframe_playlists']]
+
+    return PlaylistSummary(data['is_variant'], data['base_uri'], playlists, media, iframe_playlists)
+# enddef summary_from_dict()
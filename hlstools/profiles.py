@@ -0,0 +1,287 @@
+"""
+Profile listing: the bandwidths and resolutions of the streams in a master playlist.
+
+The default (legacy) output is one CSV line per master playlist, the other
+--format options come from hlstools.writers. Those also have a row for each
+#EXT-X-MEDIA rendition and I-frame playlist of the master.
+"""
+
+import os
+import sqlite3
+import sys
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from urlparse import urljoin
+
+from hlstools import fetch, writers
+from hlstools.common import argument_error, iter_urls, render_date_iso8601, verify_url
+from hlstools.history import ProfileHistory, diff_ladders, parse_time, render_rendition
+from hlstools.playlist import IFRAME_TYPE, RENDITION_TYPES
+
+# The profiles of one master playlist, stats_list is None without --media-stats.
+# renditions has a RenditionProfile for each #EXT-X-MEDIA rendition and I-frame playlist.
+ProfileRecord = namedtuple('ProfileRecord', ['timestamp', 'url', 'playlists', 'stats_list', 'renditions'])
+
+# stream_info is None for an #EXT-X-MEDIA rendition, stats is None without --media-stats
+RenditionProfile = namedtuple('RenditionProfile', ['type', 'uri', 'group_id', 'language', 'name', 'stream_info', 'stats'])
+
+# Maximum number of stream playlists downloaded at the same time for the --media-stats of a master playlist
+MEDIA_STATS_CONCURRENCY = 8
+
+def add_arguments(parser):
+    parser.add_argument('-o', '--output',
+                        action='store',
+                        help='Filename to write output to.')
+
+    parser.add_argument('-a', '--append',
+                        action='store_true',
+                        default=False,
+                        help='Append to the file given with the --output argument as opposed to overwriting the file')
+
+    parser.add_argument('--format',
+                        action='store',
+                        choices=writers.OUTPUT_FORMATS,
+                        default='legacy',
+                        help='Output format: "legacy" is one CSV line per master playlist, "csv" (with a header) and "ndjson" have one row per variant, "parquet" writes a Parquet file (needs pyarrow and --output) (default: legacy)')
+
+    parser.add_argument('--history',
+                        action='store',
+                        metavar='FILE',
+                        help='SQLite file keeping the ladder of every master playlist over time. A ladder is only stored when it changed since the last run, the renditions added, removed or changed are reported on stderr')
+
+    parser.add_argument('--show-history',
+                        action='store_true',
+                        default=False,
+                        help='Print the ladder changes of the URLs stored in the --history file instead of downloading them')
+
+    parser.add_argument('--since',
+                        action='store',
+                        help='With --show-history, only show the changes from this time on: YYYY-MM-DD[THH:MM[:SS]] in local time')
+
+    parser.add_argument('--until',
+                        action='store',
+                        help='With --show-history, only show the changes up to this time: YYYY-MM-DD[THH:MM[:SS]] in local time')
+# enddef add_arguments()
+
+def check_arguments(parser, args):
+    error = None
+
+    if args.format == 'parquet' and (not args.output or args.append or args.checkpoint):
+        error = "--format parquet needs --output and can't be used with --append or --checkpoint"
+    elif args.show_history and not args.history:
+        error = "--show-history needs a --history file"
+
+    for name in ('since', 'until'):
+        if getattr(args, name) is not None:
+            try:
+                setattr(args, name, parse_time(getattr(args, name)))
+            except ValueError as time_error:
+                error = "--%s: %s" % (name, time_error)
+
+    if error is not None:
+        argument_error(parser, "%s" % error, 1)
+# enddef check_arguments()
+
+# Opens the --output file, or returns None to write to stdout
+def open_output(args):
+    outfile = None
+
+    if args.output:
+        try:
+            outfile = open(args.output, 'a' if args.append == True else 'w')
+        except IOError as error:
+            print >> sys.stderr, render_date_iso8601(), "Error: opening file:", args.output, ">>", error
+
+    return outfile
+# enddef open_output()
+
+def render_bandwidth(playlists, separator):
+    return separator.join(str(playlist.stream_info.bandwidth) for playlist in playlists)
+# enddef render_bandwidth()
+
+# A (width, height) resolution as WIDTHxHEIGHT, or None
+def render_resolution_value(resolution):
+    if resolution is None:
+        return 'None'
+
+    return 'x'.join(str(value) for value in resolution)
+# enddef render_resolution_value()
+
+def render_resolution(playlists, separator):
+    return separator.join(render_resolution_value(playlist.stream_info.resolution) for playlist in playlists)
+# enddef render_resolution()
+
+# The MediaStats of a stream as segments:duration:min:max:mean:over_target:discontinuities, or the error loading it
+def render_media_stats_value(stats):
+    if isinstance(stats, str):
+        return "Error: %s" % stats.replace(',', ';')
+    elif stats.segments < 1:
+        return '0:0.000:None:None:None:0:%d' % stats.discontinuities
+
+    return '%d:%.3f:%.3f:%.3f:%.3f:%d:%d' % (stats.segments, stats.total_duration, stats.min_duration,
+                                             stats.max_duration, stats.mean_duration,
+                                             stats.target_violations, stats.discontinuities)
+# enddef render_media_stats_value()
+
+def render_media_stats(stats_list, separator):
+    return separator.join(render_media_stats_value(stats) for stats in stats_list)
+# enddef render_media_stats()
+
+def render_csv(url, playlists, stats_list=None, timestamp=None):
+    fields = [timestamp or render_date_iso8601(), url, render_bandwidth(playlists, ","), render_resolution(playlists, ",")]
+    if stats_list is not None:
+        fields.append(render_media_stats(stats_list, ","))
+
+    return ','.join(fields)
+# enddef render_csv()
+
+# Returns the MediaStats of a stream playlist, or the error message when it can't be downloaded
+def load_stream_stats(stream_url):
+    try:
+        return fetch.get_session().load_media(stream_url).stats
+    except IOError as error:
+        return str(error)
+# enddef load_stream_stats()
+
+# Returns the MediaStats (or error message) of each stream playlist, in the order of the URIs
+def load_media_stats(base_uri, uris):
+    pool = ThreadPool(max(1, min(MEDIA_STATS_CONCURRENCY, len(uris))))
+    try:
+        return pool.map(load_stream_stats, [urljoin(base_uri, uri) for uri in uris])
+    finally:
+        pool.close()
+        pool.join()
+# enddef load_media_stats()
+
+def get_rendition_profiles(m3u8_obj):
+    renditions = [RenditionProfile(media.type, media.uri, media.group_id, media.language, media.name, None, None)
+                  for media in m3u8_obj.media if media.type in RENDITION_TYPES and media.uri]
+    renditions.extend(RenditionProfile(IFRAME_TYPE, playlist.uri, None, None, None, playlist.iframe_stream_info, None)
+                      for playlist in m3u8_obj.iframe_playlists)
+
+    return renditions
+# enddef get_rendition_profiles()
+
+# Returns the ProfileRecord of a master playlist. The stats of the variants and the renditions are loaded together.
+def make_record(url, m3u8_obj, media_stats=False):
+    renditions = get_rendition_profiles(m3u8_obj)
+    stats_list = None
+
+    if media_stats:
+        variant_count = len(m3u8_obj.playlists)
+        all_stats = load_media_stats(m3u8_obj.base_uri, [playlist.uri for playlist in m3u8_obj.playlists] +
+                                     [rendition.uri for rendition in renditions])
+        stats_list = all_stats[:variant_count]
+        renditions = [rendition._replace(stats=stats) for rendition, stats in zip(renditions, all_stats[variant_count:])]
+
+    return ProfileRecord(render_date_iso8601(), url, m3u8_obj.playlists, stats_list, renditions)
+# enddef make_record()
+
+# Returns a tuple of the ProfileRecord for the URL (or None) and the error message for it (or None)
+def list_url(url, media_stats=False):
+    if verify_url(url) == True:
+        try:
+            m3u8_obj = fetch.load_master(url)
+            if m3u8_obj.is_variant:
+                return (make_record(url, m3u8_obj, media_stats), None)
+            else:
+                return (None, ' '.join([render_date_iso8601(), "Error for url:", url, "Doesn't contain any stream playlists"]))
+        except IOError as error:
+            return (None, ' '.join([render_date_iso8601(), "Error for url:", url, ">>", str(error)]))
+    else:
+        return (None, ' '.join([render_date_iso8601(), "Error: Not a valid URL >>", url]))
+# enddef list_url()
+
+class LegacyWriter(writers.ProfileWriter):
+    """
+    The original format: one CSV line per master playlist, flushed so each URL is saved as soon as it's done.
+    """
+
+    def write(self, record):
+        print >> self.outfile, render_csv(record.url, record.playlists, record.stats_list, record.timestamp)
+        self.outfile.flush()
+    # enddef write()
+# endclass LegacyWriter
+
+
+# Returns the writer for the --format, to the --output file or stdout
+def open_writer(args):
+    media_stats = getattr(args, 'media_stats', False)
+
+    if args.format == 'parquet':
+        try:
+            return writers.ParquetWriter(args.output, media_stats)
+        except (writers.WriterError, IOError) as error:
+            print >> sys.stderr, render_date_iso8601(), "Error:", error
+            exit(1)
+
+    outfile = open_output(args) or sys.stdout
+
+    if args.format == 'csv':
+        # Appending to a file that already has rows, which start with the header
+        header = not (args.append and outfile is not sys.stdout and os.path.getsize(args.output) > 0)
+        return writers.CsvWriter(outfile, media_stats, bool(args.checkpoint), header)
+    elif args.format == 'ndjson':
+        return writers.NdjsonWriter(outfile, media_stats, bool(args.checkpoint))
+
+    return LegacyWriter(outfile, media_stats)
+# enddef open_writer()
+
+# Opens the --history file, or returns None without one
+def open_history(args):
+    if not args.history:
+        return None
+
+    try:
+        return ProfileHistory(args.history, bool(args.checkpoint))
+    except sqlite3.Error as error:
+        print >> sys.stderr, render_date_iso8601(), "Error: opening history:", args.history, ">>", error
+        exit(1)
+# enddef open_history()
+
+# Stores the ladder of a ProfileRecord in the history and reports how it changed since the last run
+def record_history(record, history):
+    previous, changes = history.record(record.url, record.timestamp, record.playlists)
+    if changes:
+        print >> sys.stderr, record.timestamp, "Ladder changed for url:", record.url, "since", previous.timestamp, ">>", ', '.join(changes)
+# enddef record_history()
+
+# Prints the ladder changes of each URL in the history, returns the number of URLs found
+def show_history(args):
+    history = open_history(args)
+    count = 0
+
+    try:
+        for url in iter_urls(args):
+            snapshots = history.query(url, args.since, args.until)
+            if len(snapshots) < 1:
+                print >> sys.stderr, render_date_iso8601(), "No history for url:", url
+                continue
+
+            count += 1
+            previous = None
+            for snapshot in snapshots:
+                if previous is None:
+                    print snapshot.timestamp, url, ">>", ', '.join(render_rendition(rendition) for rendition in snapshot.renditions)
+                else:
+                    print snapshot.timestamp, url, ">>", ', '.join(diff_ladders(previous.renditions, snapshot.renditions))
+                previous = snapshot
+    finally:
+        history.close()
+
+    return count
+# enddef show_history()
+
+# Writes the result of list_url() for one URL
+def write_result(result, writer, history=None):
+    record, error = result
+
+    if record is not None:
+        writer.write(record)
+        if history is not None:
+            record_history(record, history)
+    if error is not None:
+        print >> sys.stderr, error
+
+    return 0
+# enddef write_result()
@@ -0,0 +1,87 @@
+"""
+Segment-level availability check.
+
+Follows a media playlist into its segments and checks a sample of them with
+concurrent HEAD requests, so a rendition whose segments are missing doesn't
+report OK just because its playlist downloads.
+"""
+
+import random
+import urllib2
+from multiprocessing.pool import ThreadPool
+from urlparse import urljoin
+
+from hlstools import fetch
+
+SAMPLE_MODES = ('first', 'last', 'random', 'all')
+
+# Responses to a HEAD request meaning the server doesn't support HEAD
+HEAD_UNSUPPORTED_CODES = (405, 501)
+
+# Yields the segment URIs of a media playlist. Every line that isn't blank or a tag/comment is a segment.
+def iter_segment_uris(content):
+    for line in content.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+# enddef iter_segment_uris()
+
+def sample_segments(segment_uris, mode, count):
+    if mode == 'all' or len(segment_uris) <= count:
+        return segment_uris
+    elif mode == 'first':
+        return segment_uris[:count]
+    elif mode == 'last':
+        return segment_uris[-count:]
+
+    return random.sample(segment_uris, count)
+# enddef sample_segments()
+
+# Returns None if the segment is available, otherwise the error message
+def check_segment(segment_url):
+    session = fetch.get_session()
+
+    try:
+        session.fetch(segment_url, method='HEAD')
+        return None
+    except urllib2.HTTPError as error:
+        if error.code not in HEAD_UNSUPPORTED_CODES:
+            return str(error)
+    except IOError as error:
+        return str(error)
+
+    # HEAD isn't supported, ask for the first byte instead
+    try:
+        session.fetch(segment_url, headers={'Range': 'bytes=0-0', 'Accept-Encoding': 'identity'}, max_bytes=1)
+        return None
+    except IOError as error:
+        return str(error)
+# enddef check_segment()
+
+# Downloads a media playlist and checks a sample of its segments, with at most `concurrency` requests at a time.
+# Returns the same (return code, result) tuple as availability.check_stream().
+def check_stream_segments(stream_url, mode, count, concurrency):
+    try:
+        response = fetch.get_session().fetch(stream_url)
+    except IOError as error:
+        return (2, str(error))
+
+    segment_uris = sample_segments(list(iter_segment_uris(response.body)), mode, count)
+    if len(segment_uris) < 1:
+        return (1, "No segments")
+
+    segment_urls = [urljoin(response.url, segment_uri) for segment_uri in segment_uris]
+
+    pool = ThreadPool(min(concurrency, len(segment_urls)))
+    try:
+        errors = pool.map(check_segment, segment_urls)
+    finally:
+        pool.close()
+        pool.join()
+
+    failed = [(segment_uri, error) for segment_uri, error in zip(segment_uris, errors) if error is not None]
+    if len(failed) < 1:
+        return (0, "OK")
+
+    return (2, "%d/%d segments failed (%s: %s)" % (len(failed), len(segment_uris), failed[0][0], failed[0][1]))
+# enddef check_stream_segments()
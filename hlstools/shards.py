@@ -0,0 +1,178 @@
+"""
+Sharded sweeps: splitting a --file URL list over several processes or hosts.
+
+Every URL is placed on a consistent hash ring of the N shards (VNODES points
+per shard, from MD5 so every host agrees), and `--shard I/N` only checks the
+URLs that land on shard I. Adding a shard only moves the URLs the new shard
+takes over. The shards share nothing but a directory: each one writes a
+summary of its run (worst return code and the URL count per return code) to
+shard-I-of-N.json in the --shard-dir, and the merge step reads them back into
+a single Sensu line and return code, the worst of all the shards. A shard
+missing, stale, cut short by its deadline or left over from a sweep of
+another URL list makes the merged result at least a WARNING, like the URLs
+left out by a --deadline.
+"""
+
+import bisect
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+
+from hlstools.common import set_return_code
+
+VNODES = 128
+
+SHARD_PATTERN = re.compile(r'^(\d+)/(\d+)$')
+
+# Returns the (index, count) of a I/N shard, with I from 1 to N. Raises ValueError if it isn't one.
+def parse_shard(value):
+    match = SHARD_PATTERN.match(value)
+    if match is None or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise ValueError('Invalid shard: %s, expected I/N with I from 1 to N' % value)
+
+    return (int(match.group(1)), int(match.group(2)))
+# enddef parse_shard()
+
+def get_hash(value):
+    return int(hashlib.md5(value).hexdigest()[:16], 16)
+# enddef get_hash()
+
+
+class ShardRing(object):
+
+    def __init__(self, count):
+        self.count = count
+        points = sorted((get_hash('shard-%d-%d' % (shard, vnode)), shard)
+                        for shard in range(1, count + 1) for vnode in range(VNODES))
+        self._hashes = [point[0] for point in points]
+        self._shards = [point[1] for point in points]
+
+    def get_shard(self, url):
+        """
+        Returns the shard (from 1 to count) a URL belongs to.
+        """
+        idx = bisect.bisect(self._hashes, get_hash(url))
+        return self._shards[idx % len(self._shards)]
+    # enddef get_shard()
+# endclass ShardRing
+
+
+# Yields the URLs of one shard
+def filter_shard(urls, index, count):
+    ring = ShardRing(count)
+    for url in urls:
+        if ring.get_shard(url) == index:
+            yield url
+# enddef filter_shard()
+
+def get_shard_filename(shard_dir, index, count):
+    return os.path.join(shard_dir, 'shard-%d-of-%d.json' % (index, count))
+# enddef get_shard_filename()
+
+
+class ShardSummary(object):
+    """
+    The results of one shard's run, as written to its file.
+    """
+
+    def __init__(self, index, count, source):
+        self.index = index
+        self.count = count
+        self.source = source
+        self.result_code = 0
+        self.codes = {}
+        self.complete = False
+
+    def restore(self, result_code, codes):
+        self.result_code = result_code
+        self.codes = dict(codes)
+    # enddef restore()
+
+    def update(self, result_code):
+        self.codes[result_code] = self.codes.get(result_code, 0) + 1
+        self.result_code = set_return_code(self.result_code, result_code)
+    # enddef update()
+
+    def save(self, shard_dir):
+        # Written in one go, the merge may run at any time
+        filename = get_shard_filename(shard_dir, self.index, self.count)
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as shard_file:
+            json.dump({'shard': '%d/%d' % (self.index, self.count),
+                       'source': self.source,
+                       'finished': time.time(),
+                       'complete': self.complete,
+                       'result_code': self.result_code,
+                       'codes': dict((str(code), count) for code, count in self.codes.items())}, shard_file)
+        os.rename(tmp_filename, filename)
+    # enddef save()
+# endclass ShardSummary
+
+
+def render_counts(codes):
+    names = {0: 'OK', 1: 'WARNING', 2: 'CRITICAL'}
+    return ', '.join('%d %s' % (count, names.get(code, 'UNKNOWN')) for code, count in sorted(codes.items()))
+# enddef render_counts()
+
+def merge_shards(shard_dir, count, max_age=None):
+    """
+    Reads the shard files of a sweep over `count` shards. Returns the worst return code and the brief
+    output, one line summing up all the shards.
+    """
+    result_code = 0
+    codes = {}
+    problems = []
+    now = time.time()
+
+    states = {}
+    for filename in glob.glob(os.path.join(shard_dir, 'shard-*-of-%d.json' % count)):
+        try:
+            with open(filename) as shard_file:
+                state = json.load(shard_file)
+            index, _ = parse_shard(state['shard'])
+        except (IOError, ValueError, KeyError) as error:
+            problems.append('%s: %s' % (os.path.basename(filename), error))
+            result_code = set_return_code(result_code, 1)
+            continue
+        states[index] = state
+
+    # The sweep is the URL list most of the shards ran over, the first shard's on a tie
+    sources = [state.get('source') for _, state in sorted(states.items())]
+    source = max(sources, key=sources.count) if sources else None
+
+    for index in range(1, count + 1):
+        state = states.get(index)
+        if state is None:
+            problems.append('shard %d/%d missing' % (index, count))
+            result_code = set_return_code(result_code, 1)
+            continue
+
+        if state.get('source') != source:
+            problems.append('shard %d/%d from another URL list: %s' % (index, count, state.get('source')))
+            result_code = set_return_code(result_code, 1)
+            continue
+
+        if max_age is not None and now - state['finished'] > max_age:
+            problems.append('shard %d/%d stale, finished %ds ago' % (index, count, now - state['finished']))
+            result_code = set_return_code(result_code, 1)
+            continue
+
+        if not state['complete']:
+            problems.append('shard %d/%d incomplete' % (index, count))
+            result_code = set_return_code(result_code, 1)
+
+        result_code = set_return_code(result_code, int(state['result_code']))
+        for code, code_count in state['codes'].items():
+            codes[int(code)] = codes.get(int(code), 0) + code_count
+
+    output = '%d shards, %d URLs' % (count, sum(codes.values()))
+    if codes:
+        output += ' >> ' + render_counts(codes)
+    if problems:
+        output += ' >> ' + ', '.join(problems)
+
+    return (result_code, output)
+# enddef merge_shards()
@@ -0,0 +1,196 @@
+"""
+Per-host adaptive rate and concurrency limits for the Session.
+
+Every request to a host first waits for a free slot under the host's
+concurrency limit and for a token of its token bucket (refilled at the rate
+limit, holding up to one second of requests). Both limits adapt like TCP
+congestion control (AIMD):
+* they're halved, at most once per DECREASE_INTERVAL, when the host answers
+  with a 429 or 503, a request times out or the time to first byte (averaged
+  over the last few requests) rises to LATENCY_FACTOR times the fastest seen,
+* each healthy response raises them by 1/limit, ie. by about one a round trip,
+  back up to the configured maximum.
+A Retry-After on a 429/503 also holds the host's requests back for that long.
+Either limit can be left out (0), only the other one is applied then.
+"""
+
+import threading
+import time
+
+CONGESTION_CODES = (429, 503)
+
+# Time to first byte above this many times the fastest one (plus the slack) means the host is loaded
+LATENCY_FACTOR = 2.0
+LATENCY_SLACK = 0.05
+
+# Weight of the last request in the average time to first byte
+LATENCY_WEIGHT = 0.2
+
+DECREASE_INTERVAL = 1.0
+
+MIN_RATE = 0.5
+
+MAX_RETRY_AFTER = 60.0
+
+# Longest a request waits before checking its deadline again
+MAX_WAIT = 1.0
+
+class HostLimit(object):
+
+    def __init__(self, max_concurrency, max_rate):
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.max_rate = max_rate
+        self.rate = float(max_rate)
+        self.tokens = 1.0
+        self.refilled = time.time()
+        self.in_flight = 0
+        self.min_latency = None
+        self.latency = None
+        self.decreased = 0
+        self.paused_until = 0
+        self.requests = 0
+        self.congested = 0
+        self.waited = 0.0
+
+    # Returns the seconds to wait before a request can go out, 0 when it can go now or None to wait for a request to finish
+    def get_wait(self, now):
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        if self.max_concurrency and self.in_flight >= int(self.concurrency):
+            return None
+
+        if self.max_rate:
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.refilled) * self.rate)
+            self.refilled = now
+            if self.tokens < 1.0:
+                return (1.0 - self.tokens) / self.rate
+
+        return 0
+    # enddef get_wait()
+
+    def start(self):
+        self.in_flight += 1
+        self.requests += 1
+        if self.max_rate:
+            self.tokens -= 1.0
+    # enddef start()
+
+    def decrease(self, now):
+        if now - self.decreased < DECREASE_INTERVAL:
+            return
+
+        self.decreased = now
+        if self.max_concurrency:
+            self.concurrency = max(1.0, self.concurrency / 2)
+        if self.max_rate:
+            self.rate = max(MIN_RATE, self.rate / 2)
+    # enddef decrease()
+
+    def increase(self):
+        if self.max_concurrency:
+            self.concurrency = min(float(self.max_concurrency), self.concurrency + 1.0 / self.concurrency)
+        if self.max_rate:
+            self.rate = min(float(self.max_rate), self.rate + 1.0 / self.rate)
+    # enddef increase()
+
+    def is_slow(self, latency):
+        self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+        self.latency = latency if self.latency is None else self.latency + LATENCY_WEIGHT * (latency - self.latency)
+        return self.latency > self.min_latency * LATENCY_FACTOR + LATENCY_SLACK
+    # enddef is_slow()
+# endclass HostLimit
+
+
+class Throttle(object):
+
+    def __init__(self, max_concurrency=0, max_rate=0):
+        self.max_concurrency = max_concurrency
+        self.max_rate = max_rate
+        self._hosts = {}
+        self._cond = threading.Condition()
+
+    def _get_host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostLimit(self.max_concurrency, self.max_rate)
+        return state
+    # enddef _get_host()
+
+    def acquire(self, host, deadline=None):
+        """
+        Waits until a request can be made to the host. Returns False, without taking a slot, if that would be after the deadline.
+        """
+        with self._cond:
+            state = self._get_host(host)
+            start = time.time()
+            while True:
+                now = time.time()
+                wait = state.get_wait(now)
+                if wait == 0:
+                    break
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wait = min(wait if wait is not None else MAX_WAIT, deadline - now)
+                self._cond.wait(min(wait, MAX_WAIT) if wait is not None else MAX_WAIT)
+
+            state.start()
+            state.waited += time.time() - start
+            return True
+    # enddef acquire()
+
+    def release(self, host, status=None, latency=None, retry_after=None, failed=False):
+        """
+        Frees the slot of a finished request and adapts the limits of its host. `failed` is True when the
+        request got no response (eg. a timeout). With neither a status nor `failed` the request never got
+        to the host (eg. the deadline passed) and the limits are left alone.
+        """
+        with self._cond:
+            state = self._get_host(host)
+            state.in_flight -= 1
+            now = time.time()
+
+            if status is None and not failed:
+                pass
+            elif failed or status in CONGESTION_CODES:
+                state.congested += 1
+                state.decrease(now)
+                if retry_after:
+                    state.paused_until = max(state.paused_until, now + min(retry_after, MAX_RETRY_AFTER))
+            elif state.is_slow(latency):
+                state.decrease(now)
+            else:
+                state.increase()
+
+            self._cond.notify_all()
+    # enddef release()
+
+    def render_limits(self):
+        """
+        Returns a line per host with its current limits and how much its requests were held back.
+        """
+        lines = []
+        with self._cond:
+            for host, state in sorted(self._hosts.items()):
+                limits = []
+                if state.max_concurrency:
+                    limits.append('concurrency %.1f of %d' % (state.concurrency, state.max_concurrency))
+                if state.max_rate:
+                    limits.append('rate %.1f of %g requests/s' % (state.rate, state.max_rate))
+                lines.append('%s: %s, %d requests, %d congested, %.1fs waited' % (
+                    host, ', '.join(limits), state.requests, state.congested, state.waited))
+
+        return lines
+    # enddef render_limits()
+# endclass Throttle
+
+
+# Returns the seconds of a Retry-After header, or None when it's missing or a date
+def parse_retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+# enddef parse_retry_after()
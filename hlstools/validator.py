@@ -0,0 +1,338 @@
+"""
+Streaming validator for media playlists.
+
+The full check downloads a stream playlist into memory before reading it, and
+the fetch memo keeps the body for the rest of the run, so a sweep of 6-hour
+DVR playlists holds megabytes per rendition. A MediaValidator is instead fed
+the body a chunk at a time as it downloads (see Session.stream()) and checks
+it line by line, keeping only the current line and a few counters:
+* the #EXTM3U header,
+* the syntax of the tags it knows, and that the ones allowed once only appear
+  once, in a media playlist rather than a master one,
+* sequence continuity: every #EXTINF is followed by its segment URI, every
+  URI has an #EXTINF, and #EXT-X-MEDIA-SEQUENCE/#EXT-X-DISCONTINUITY-SEQUENCE
+  come before the first segment,
+* #EXT-X-ENDLIST consistency: no segment after it, and an
+  #EXT-X-PLAYLIST-TYPE:VOD playlist has one.
+Tags it doesn't know are skipped, like the players do. The durations are
+summed up on the way into the same MediaStats as hlstools.mediastats.
+"""
+
+import re
+
+from hlstools.master import MASTER_TAGS
+from hlstools.mediastats import MediaStats
+
+# Longer lines are reported and skipped rather than buffered
+MAX_LINE_LENGTH = 64 * 1024
+
+# Problems kept for the output, the others are only counted
+MAX_PROBLEMS = 3
+
+INTEGER_TAGS = frozenset([
+    '#EXT-X-TARGETDURATION',
+    '#EXT-X-MEDIA-SEQUENCE',
+    '#EXT-X-DISCONTINUITY-SEQUENCE',
+    '#EXT-X-VERSION',
+])
+
+VALUELESS_TAGS = frozenset([
+    '#EXT-X-DISCONTINUITY',
+    '#EXT-X-ENDLIST',
+    '#EXT-X-I-FRAMES-ONLY',
+    '#EXT-X-INDEPENDENT-SEGMENTS',
+    '#EXT-X-GAP',
+])
+
+ATTRIBUTE_TAGS = frozenset([
+    '#EXT-X-KEY',
+    '#EXT-X-MAP',
+    '#EXT-X-DATERANGE',
+    '#EXT-X-START',
+    '#EXT-X-SERVER-CONTROL',
+    '#EXT-X-PART-INF',
+    '#EXT-X-PART',
+    '#EXT-X-PRELOAD-HINT',
+    '#EXT-X-RENDITION-REPORT',
+    '#EXT-X-SKIP',
+])
+
+# Tags that may only appear once in a playlist
+ONCE_TAGS = INTEGER_TAGS | frozenset(['#EXT-X-PLAYLIST-TYPE', '#EXT-X-ENDLIST', '#EXT-X-I-FRAMES-ONLY'])
+
+# Tags of the whole playlist, which can't follow the first segment
+HEADER_TAGS = frozenset(['#EXT-X-MEDIA-SEQUENCE', '#EXT-X-DISCONTINUITY-SEQUENCE'])
+
+# Master tags a media playlist can't have, the others (eg. #EXT-X-START) are allowed in both
+FORBIDDEN_TAGS = MASTER_TAGS - frozenset(['#EXTM3U', '#EXT-X-VERSION', '#EXT-X-INDEPENDENT-SEGMENTS', '#EXT-X-START']) | \
+    frozenset(['#EXT-X-STREAM-INF'])
+
+PLAYLIST_TYPES = ('VOD', 'EVENT')
+
+# Matched from after the "#EXTINF:"
+EXTINF_PATTERN = re.compile(r'[ \t]*([0-9]+(?:\.[0-9]*)?)[ \t]*(?:,.*)?$')
+INTEGER_PATTERN = re.compile(r'^[0-9]+$')
+BYTERANGE_PATTERN = re.compile(r'^[0-9]+(?:@[0-9]+)?$')
+DATE_TIME_PATTERN = re.compile(r'^[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}(?:\.[0-9]+)?(?:Z|[+-][0-9]{2}(?::?[0-9]{2})?)?$')
+ATTRIBUTE_LIST_PATTERN = re.compile(r'^[A-Z0-9-]+=(?:"[^"\r\n]*"|[^",]+)(?:,[A-Z0-9-]+=(?:"[^"\r\n]*"|[^",]+))*$')
+
+class MediaValidator(object):
+    """
+    Checks a media playlist fed to it a chunk at a time. `problems` has the first MAX_PROBLEMS
+    problems found, `problem_count` the number of all of them.
+    """
+
+    def __init__(self):
+        self.problems = []
+        self.problem_count = 0
+        self.line_number = 0
+        self.segments = 0
+        self.total_duration = 0.0
+        self.min_duration = None
+        self.max_duration = None
+        self.target_duration = None
+        self.target_violations = 0
+        self.discontinuities = 0
+        self.media_sequence = 0
+        self.ended = False
+        self._partial = ''
+        self._skipping = False
+        self._header = False
+        self._invalid = False
+        self._seen = set()
+        self._playlist_type = None
+        self._duration = None
+
+    def feed(self, data):
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+
+        if self._skipping and lines:
+            # The rest of a line too long to check
+            lines[0] = ''
+            self._skipping = False
+
+        if self._invalid:
+            self.line_number += len(lines)
+        else:
+            self._check_lines(lines)
+
+        if len(self._partial) > MAX_LINE_LENGTH:
+            if not self._skipping:
+                self.fail('line %d longer than %d bytes' % (self.line_number + 1, MAX_LINE_LENGTH))
+            self._partial = ''
+            self._skipping = True
+    # enddef feed()
+
+    def close(self):
+        """
+        Checks the last line and the playlist as a whole, once all of it has been fed.
+        """
+        if self._partial and not self._skipping and not self._invalid:
+            self.line_number += 1
+            self._check_line(self._partial.rstrip('\r'))
+        self._partial = ''
+
+        if self._invalid:
+            return
+
+        if not self._header:
+            self.fail('empty playlist')
+            return
+
+        if self._duration is not None:
+            self.fail('last #EXTINF without a segment URI')
+
+        if self.target_duration is None:
+            self.fail('missing #EXT-X-TARGETDURATION')
+
+        if self._playlist_type == 'VOD' and not self.ended:
+            self.fail('#EXT-X-PLAYLIST-TYPE:VOD without #EXT-X-ENDLIST')
+
+        if self.segments < 1:
+            self.fail('no segments')
+    # enddef close()
+
+    def fail(self, message):
+        self.problem_count += 1
+        if len(self.problems) < MAX_PROBLEMS:
+            self.problems.append(message)
+    # enddef fail()
+
+    # The #EXTINF and URI lines of the segments, most of a playlist, are checked inline with the
+    # counters in local variables, the other lines by _check_line()
+    def _check_lines(self, lines):
+        number = self.line_number
+        duration = self._duration
+        segments, total_duration, violations, min_duration, max_duration, over_target = self._load_counters()
+
+        for line in lines:
+            number += 1
+            if duration is None:
+                if line[:8] == '#EXTINF:' and self._header and not self.ended:
+                    match = EXTINF_PATTERN.match(line, 8)
+                    if match is not None:
+                        duration = float(match.group(1))
+                        continue
+            elif line[:1] not in '#\r\t ':
+                segments += 1
+                total_duration += duration
+                if duration < min_duration:
+                    min_duration = duration
+                if duration > max_duration:
+                    max_duration = duration
+                # A segment is too long when its duration rounded to the nearest integer is over the target.
+                # Segments before a (late) #EXT-X-TARGETDURATION aren't kept to be checked against it.
+                if duration >= over_target:
+                    violations += 1
+                duration = None
+                continue
+
+            self.line_number = number
+            self._duration = duration
+            self._store_counters(segments, total_duration, violations, min_duration, max_duration)
+            self._check_line(line.rstrip('\r'))
+            duration = self._duration
+            segments, total_duration, violations, min_duration, max_duration, over_target = self._load_counters()
+
+        self.line_number = number
+        self._duration = duration
+        self._store_counters(segments, total_duration, violations, min_duration, max_duration)
+    # enddef _check_lines()
+
+    def _load_counters(self):
+        return (self.segments,
+                self.total_duration,
+                self.target_violations,
+                self.min_duration if self.min_duration is not None else float('inf'),
+                self.max_duration if self.max_duration is not None else float('-inf'),
+                self.target_duration + 0.5 if self.target_duration is not None else float('inf'))
+    # enddef _load_counters()
+
+    def _store_counters(self, segments, total_duration, violations, min_duration, max_duration):
+        self.segments = segments
+        self.total_duration = total_duration
+        self.target_violations = violations
+        if segments:
+            self.min_duration = min_duration
+            self.max_duration = max_duration
+    # enddef _store_counters()
+
+    def _check_line(self, line):
+        if not self._header:
+            # Like the range probe, a BOM or blank lines before the header are let through
+            line = line.lstrip('\xef\xbb\xbf \t').rstrip(' \t')
+            if not line or self._invalid:
+                return
+            if line != '#EXTM3U':
+                self.fail('missing #EXTM3U header')
+                self._invalid = True
+                return
+            self._header = True
+            return
+
+        if not line.startswith('#'):
+            if line.strip():
+                self._check_segment()
+            return
+
+        if not line.startswith('#EXT'):
+            # A comment
+            return
+
+        tag, separator, value = line.partition(':')
+
+        if tag == '#EXTINF':
+            self._check_extinf(value)
+            return
+
+        if tag in FORBIDDEN_TAGS:
+            self.fail('line %d: %s in a media playlist' % (self.line_number, tag))
+            return
+
+        if tag in ONCE_TAGS:
+            if tag in self._seen:
+                self.fail('line %d: more than one %s' % (self.line_number, tag))
+            self._seen.add(tag)
+
+        if tag in HEADER_TAGS and self.segments > 0:
+            self.fail('line %d: %s after the first segment' % (self.line_number, tag))
+
+        if tag in INTEGER_TAGS:
+            if not INTEGER_PATTERN.match(value.strip()):
+                self.fail('line %d: invalid %s' % (self.line_number, tag))
+            elif tag == '#EXT-X-TARGETDURATION':
+                self.target_duration = int(value)
+            elif tag == '#EXT-X-MEDIA-SEQUENCE':
+                self.media_sequence = int(value)
+        elif tag in VALUELESS_TAGS:
+            if separator:
+                self.fail('line %d: %s takes no value' % (self.line_number, tag))
+            elif tag == '#EXT-X-ENDLIST':
+                self.ended = True
+            elif tag == '#EXT-X-DISCONTINUITY':
+                self.discontinuities += 1
+        elif tag in ATTRIBUTE_TAGS:
+            if not ATTRIBUTE_LIST_PATTERN.match(value):
+                self.fail('line %d: invalid %s attribute list' % (self.line_number, tag))
+        elif tag == '#EXT-X-PLAYLIST-TYPE':
+            self._playlist_type = value.strip()
+            if self._playlist_type not in PLAYLIST_TYPES:
+                self.fail('line %d: invalid #EXT-X-PLAYLIST-TYPE' % self.line_number)
+        elif tag == '#EXT-X-BYTERANGE':
+            if not BYTERANGE_PATTERN.match(value.strip()):
+                self.fail('line %d: invalid #EXT-X-BYTERANGE' % self.line_number)
+        elif tag == '#EXT-X-PROGRAM-DATE-TIME':
+            if not DATE_TIME_PATTERN.match(value.strip()):
+                self.fail('line %d: invalid #EXT-X-PROGRAM-DATE-TIME' % self.line_number)
+    # enddef _check_line()
+
+    def _check_extinf(self, value):
+        if self.ended:
+            self.fail('line %d: segment after #EXT-X-ENDLIST' % self.line_number)
+        if self._duration is not None:
+            self.fail('line %d: #EXTINF without a segment URI' % (self.line_number - 1))
+
+        match = EXTINF_PATTERN.match(value)
+        if match is None:
+            self.fail('line %d: invalid #EXTINF' % self.line_number)
+            self._duration = 0.0
+            return
+
+        self._duration = float(match.group(1))
+    # enddef _check_extinf()
+
+    # The segment URIs _check_lines() doesn't count inline, eg. with leading spaces
+    def _check_segment(self):
+        duration = self._duration
+        if duration is None:
+            self.fail('line %d: segment URI without #EXTINF' % self.line_number)
+            return
+
+        self._duration = None
+        segments, total_duration, violations, min_duration, max_duration, over_target = self._load_counters()
+        self._store_counters(segments + 1, total_duration + duration, violations + (duration >= over_target),
+                             min(min_duration, duration), max(max_duration, duration))
+    # enddef _check_segment()
+
+    def get_stats(self):
+        return MediaStats(self.segments,
+                          self.total_duration,
+                          self.min_duration,
+                          self.max_duration,
+                          self.total_duration / self.segments if self.segments else None,
+                          self.target_duration,
+                          self.target_violations,
+                          self.discontinuities,
+                          self.media_sequence,
+                          self.ended)
+    # enddef get_stats()
+
+    # One line summary of the problems, for the check output
+    def render_problems(self):
+        result = "Invalid playlist: " + ", ".join(self.problems)
+        if self.problem_count > len(self.problems):
+            result += " (%d more)" % (self.problem_count - len(self.problems))
+        return result
+    # enddef render_problems()
+# endclass MediaValidator
@@ -0,0 +1,241 @@
+"""
+Watch mode for live streams.
+
+Polls each media playlist at its #EXT-X-TARGETDURATION cadence and only parses
+the segments added since the last poll. Alerts are printed in the brief format
+when a stream's media sequence stalls, goes backwards or its window shrinks,
+and again when it recovers.
+"""
+
+import heapq
+import sys
+import time
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from urlparse import urljoin
+
+from hlstools import fetch
+from hlstools.common import print_brief, render_status, set_return_code, verify_url
+
+# Used until the first poll of a playlist tells us its target duration
+DEFAULT_TARGET_DURATION = 10
+
+# Waiting on the pool with a timeout, however long, lets Ctrl-C through
+POLL_TIMEOUT = 365 * 24 * 3600
+
+# Options of a run through the URL list, the watch keeps polling all the streams until it's stopped
+UNSUPPORTED_OPTIONS = ('deadline', 'jobs', 'checkpoint', 'metrics', 'shard', 'shard_dir')
+
+def add_arguments(parser):
+    parser.add_argument('-w', '--watch',
+                        action='store_true',
+                        default=False,
+                        help='Keep polling the stream playlists at their target duration and report when a live stream stalls or its window shrinks')
+
+    parser.add_argument('--watch-duration',
+                        action='store',
+                        type=float,
+                        default=0,
+                        help='Number of seconds to watch the streams for, 0 to watch until interrupted (default: 0)')
+
+    parser.add_argument('--stall-factor',
+                        action='store',
+                        type=float,
+                        default=3.0,
+                        help='Report a stream as stalled when no new segment was added for this many target durations (default: 3)')
+# enddef add_arguments()
+
+def check_arguments(parser, args):
+    if not args.watch:
+        return
+
+    for option in UNSUPPORTED_OPTIONS:
+        if getattr(args, option) != parser.get_default(option):
+            parser.error("--%s can't be used with --watch" % option.replace('_', '-'))
+# enddef check_arguments()
+
+
+class LiveStream(object):
+    """
+    What's known about a media playlist from the previous polls.
+    """
+
+    def __init__(self, url, label):
+        self.url = url
+        self.label = label
+        self.media_sequence = None
+        self.last_sequence = None
+        self.window = 0
+        self.target_duration = DEFAULT_TARGET_DURATION
+        self.last_advance = time.time()
+        self.ended = False
+        self.status = 0
+        self.next_poll = 0
+# endclass LiveStream
+
+
+def parse_extinf(line):
+    return float(line[len('#EXTINF:'):].split(',', 1)[0])
+# enddef parse_extinf()
+
+# Scans a media playlist, only parsing the segments after last_sequence.
+# Returns the media sequence, target duration, number of segments, new (sequence, duration, uri) segments and
+# whether the playlist has ended.
+def scan_playlist(content, last_sequence):
+    media_sequence = 0
+    target_duration = None
+    window = 0
+    new_segments = []
+    ended = False
+    extinf = None
+
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith('#'):
+            if line.startswith('#EXTINF:'):
+                extinf = line
+            elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+                media_sequence = int(line.split(':', 1)[1])
+            elif line.startswith('#EXT-X-TARGETDURATION:'):
+                target_duration = float(line.split(':', 1)[1])
+            elif line.startswith('#EXT-X-ENDLIST'):
+                ended = True
+            continue
+
+        sequence = media_sequence + window
+        window += 1
+        if last_sequence is None or sequence > last_sequence:
+            new_segments.append((sequence, parse_extinf(extinf) if extinf else None, line))
+        extinf = None
+
+    return (media_sequence, target_duration, window, new_segments, ended)
+# enddef scan_playlist()
+
+# Polls a live stream once, updating its state. Returns the return code and result message.
+def poll_stream(stream, stall_factor):
+    now = time.time()
+
+    try:
+        response = fetch.get_session().fetch(stream.url)
+        media_sequence, target_duration, window, new_segments, ended = scan_playlist(response.body, stream.last_sequence)
+    except IOError as error:
+        stream.next_poll = now + stream.target_duration
+        return (2, str(error))
+    except ValueError as error:
+        stream.next_poll = now + stream.target_duration
+        return (2, "Invalid playlist: %s" % error)
+
+    result = (0, "OK")
+
+    if target_duration:
+        stream.target_duration = target_duration
+
+    if stream.media_sequence is not None and media_sequence < stream.media_sequence:
+        result = (2, "Media sequence went back from %d to %d" % (stream.media_sequence, media_sequence))
+        # Most likely the packager restarted, start tracking the new sequence
+        new_segments = scan_playlist(response.body, None)[3]
+        stream.last_advance = now
+    elif stream.window > window and not ended:
+        result = (1, "Playlist window shrank from %d to %d segments" % (stream.window, window))
+
+    if new_segments:
+        stream.last_sequence = new_segments[-1][0]
+        stream.last_advance = now
+    elif not ended and now - stream.last_advance > stall_factor * stream.target_duration:
+        result = (2, "Media sequence stalled at %s for %ds" % (stream.last_sequence, now - stream.last_advance))
+
+    stream.media_sequence = media_sequence
+    stream.window = window
+    stream.ended = ended
+
+    # Reload after a target duration if the playlist changed, half of it if it didn't (as players do)
+    stream.next_poll = now + (stream.target_duration if new_segments else stream.target_duration / 2)
+
+    return result
+# enddef poll_stream()
+
+# Builds the list of media playlists to watch for a URL, either the streams of a master or the URL itself
+def get_live_streams(url, out_stream):
+    if verify_url(url) != True:
+        print_brief(True, out_stream, "CRITICAL: URL=", url, ">> Not a valid URL")
+        return None
+
+    try:
+        playlist = fetch.load_master(url)
+    except IOError as error:
+        print_brief(True, out_stream, "CRITICAL: URL=", url, ">>", error)
+        return None
+
+    if not playlist.is_variant:
+        return [LiveStream(url, url)]
+
+    stream_urls = [urljoin(playlist.base_uri, stream.uri) for stream in playlist.playlists]
+    return [LiveStream(stream_url, stream_url) for stream_url in stream_urls]
+# enddef get_live_streams()
+
+# Watches the streams of all the URLs until --watch-duration is over, or until interrupted with Ctrl-C.
+# Returns the worst return code seen.
+def watch_urls(urls, args, out_stream=sys.stdout):
+    result_code = 0
+    streams = []
+
+    for url in urls:
+        live_streams = get_live_streams(url, out_stream)
+        if live_streams is None:
+            result_code = 2
+        else:
+            streams.extend(live_streams)
+
+    deadline = time.time() + args.watch_duration if args.watch_duration > 0 else None
+    schedule = [(0, idx) for idx in range(len(streams))]
+    heapq.heapify(schedule)
+    pool = ThreadPool(max(1, min(args.concurrency, len(streams))))
+
+    try:
+        while schedule:
+            now = time.time()
+            if deadline is not None and now >= deadline:
+                break
+
+            if schedule[0][0] > now:
+                wait = schedule[0][0] - now
+                if deadline is not None:
+                    wait = min(wait, deadline - now)
+                time.sleep(wait)
+                continue
+
+            due = []
+            while schedule and schedule[0][0] <= now:
+                due.append(heapq.heappop(schedule)[1])
+
+            results = pool.map_async(partial(poll_stream, stall_factor=args.stall_factor),
+                                     [streams[idx] for idx in due]).get(POLL_TIMEOUT)
+            for idx, (stream_code, result) in zip(due, results):
+                stream = streams[idx]
+                result_code = set_return_code(result_code, stream_code)
+
+                if args.verbose:
+                    print_brief(True, out_stream, "\t%s: %s (sequence %s, %d segments)" % (stream.label, result, stream.last_sequence, stream.window))
+                elif stream_code != stream.status:
+                    print_brief(True, out_stream, render_status(stream_code), "URL=", stream.label, ">>", result)
+                stream.status = stream_code
+
+                if stream.ended:
+                    if args.verbose:
+                        print_brief(True, out_stream, "\t%s: Playlist ended" % stream.label)
+                else:
+                    heapq.heappush(schedule, (stream.next_poll, idx))
+
+            out_stream.flush()
+    except KeyboardInterrupt:
+        # Ctrl-C ends a watch without --watch-duration, the polls still running are dropped
+        pool.terminate()
+    finally:
+        pool.close()
+        pool.join()
+
+    return result_code
+# enddef watch_urls()
@@ -0,0 +1,237 @@
+"""
+Output formats of the profile listing.
+
+The legacy format (hlstools.profiles) is the original single CSV line per
+master playlist, with a variable number of columns. The formats here have one
+row per variant, then one per #EXT-X-MEDIA rendition and I-frame playlist (by
+`type`), with fixed columns, for loading into other tools:
+* csv: a CSV file with a header,
+* ndjson: one JSON object per line,
+* parquet: a columnar Parquet file, which needs pyarrow.
+
+Rows are written in bulk every BUFFER_ROWS rows, unless every master has to be
+saved as soon as it's done (eg. with --checkpoint).
+"""
+
+import csv
+import json
+from cStringIO import StringIO
+
+from hlstools.mediastats import MediaStats
+
+# Type of the variant rows, the others have the #EXT-X-MEDIA TYPE or I-FRAME
+VARIANT_TYPE = 'VARIANT'
+
+OUTPUT_FORMATS = ('legacy', 'csv', 'ndjson', 'parquet')
+
+BUFFER_ROWS = 1000
+
+COLUMNS = ['timestamp', 'url', 'index', 'uri', 'bandwidth', 'average_bandwidth', 'width', 'height', 'codecs', 'program_id',
+           'type', 'group_id', 'language', 'name']
+
+MEDIA_STATS_COLUMNS = ['segments', 'duration', 'min_duration', 'max_duration', 'mean_duration', 'over_target',
+                       'discontinuities', 'media_error']
+
+# pyarrow type of each column
+PARQUET_TYPES = {
+    'timestamp': 'string',
+    'url': 'string',
+    'index': 'int32',
+    'uri': 'string',
+    'bandwidth': 'int64',
+    'average_bandwidth': 'int64',
+    'width': 'int32',
+    'height': 'int32',
+    'codecs': 'string',
+    'program_id': 'int32',
+    'type': 'string',
+    'group_id': 'string',
+    'language': 'string',
+    'name': 'string',
+    'segments': 'int64',
+    'duration': 'float64',
+    'min_duration': 'float64',
+    'max_duration': 'float64',
+    'mean_duration': 'float64',
+    'over_target': 'int64',
+    'discontinuities': 'int64',
+    'media_error': 'string',
+}
+
+
+class WriterError(Exception):
+    pass
+# endclass WriterError
+
+
+# Returns the width and height of a resolution, which is None or a (width, height) tuple
+def split_resolution(resolution):
+    if not resolution:
+        return (None, None)
+
+    return (resolution[0], resolution[1])
+# enddef split_resolution()
+
+def make_row(record, idx, uri, stream_info, stats, media_stats):
+    width, height = split_resolution(stream_info.resolution if stream_info is not None else None)
+    row = {
+        'timestamp': record.timestamp,
+        'url': record.url,
+        'index': idx,
+        'uri': uri,
+        'bandwidth': stream_info.bandwidth if stream_info is not None else None,
+        'average_bandwidth': getattr(stream_info, 'average_bandwidth', None),
+        'width': width,
+        'height': height,
+        'codecs': stream_info.codecs if stream_info is not None else None,
+        'program_id': stream_info.program_id if stream_info is not None else None,
+        'type': VARIANT_TYPE,
+        'group_id': None,
+        'language': None,
+        'name': None,
+    }
+
+    if media_stats:
+        if isinstance(stats, MediaStats):
+            row.update({
+                'segments': stats.segments,
+                'duration': stats.total_duration,
+                'min_duration': stats.min_duration,
+                'max_duration': stats.max_duration,
+                'mean_duration': stats.mean_duration,
+                'over_target': stats.target_violations,
+                'discontinuities': stats.discontinuities,
+                'media_error': None,
+            })
+        else:
+            row.update(dict.fromkeys(MEDIA_STATS_COLUMNS))
+            row['media_error'] = stats
+
+    return row
+# enddef make_row()
+
+# Yields a dict per variant of a profile record, then per rendition. The index counts the rows of each type.
+def iter_rows(record, media_stats):
+    stats_list = record.stats_list or [None] * len(record.playlists)
+
+    for idx, (playlist, stats) in enumerate(zip(record.playlists, stats_list)):
+        yield make_row(record, idx, playlist.uri, playlist.stream_info, stats, media_stats)
+
+    counts = {}
+    for rendition in record.renditions:
+        idx = counts[rendition.type] = counts.get(rendition.type, -1) + 1
+        row = make_row(record, idx, rendition.uri, rendition.stream_info, rendition.stats, media_stats)
+        row.update({
+            'type': rendition.type,
+            'group_id': rendition.group_id,
+            'language': rendition.language,
+            'name': rendition.name,
+        })
+        yield row
+# enddef iter_rows()
+
+
+class ProfileWriter(object):
+    """
+    Writes profile records to a file. Subclasses implement write_row() to render a row into
+    self.buffer, or override write() to render a whole record at once.
+    """
+
+    def __init__(self, outfile, media_stats=False, flush_each=False):
+        self.outfile = outfile
+        self.columns = COLUMNS + MEDIA_STATS_COLUMNS if media_stats else COLUMNS
+        self.media_stats = media_stats
+        self.flush_each = flush_each
+        self.buffer = StringIO()
+        self.pending = 0
+
+    def write(self, record):
+        for row in iter_rows(record, self.media_stats):
+            self.write_row(row)
+            self.pending += 1
+
+        if self.flush_each or self.pending >= BUFFER_ROWS:
+            self.flush()
+    # enddef write()
+
+    def write_row(self, row):
+        """
+        Renders the dict of a row, as made by make_row(), into self.buffer. Every writer using write() implements it.
+        """
+        raise NotImplementedError('%s must implement write_row()' % type(self).__name__)
+    # enddef write_row()
+
+    def flush(self):
+        self.outfile.write(self.buffer.getvalue())
+        self.outfile.flush()
+        self.buffer = StringIO()
+        self.pending = 0
+    # enddef flush()
+
+    def close(self):
+        self.flush()
+    # enddef close()
+# endclass ProfileWriter
+
+
+class CsvWriter(ProfileWriter):
+
+    def __init__(self, outfile, media_stats=False, flush_each=False, header=True):
+        ProfileWriter.__init__(self, outfile, media_stats, flush_each)
+        self.writer = csv.DictWriter(self.buffer, self.columns)
+        if header:
+            self.writer.writeheader()
+
+    def write_row(self, row):
+        self.writer.writerow(row)
+
+    def flush(self):
+        ProfileWriter.flush(self)
+        self.writer = csv.DictWriter(self.buffer, self.columns)
+    # enddef flush()
+# endclass CsvWriter
+
+
+class NdjsonWriter(ProfileWriter):
+
+    def write_row(self, row):
+        self.buffer.write(json.dumps(row, sort_keys=True, separators=(',', ':')))
+        self.buffer.write('\n')
+# endclass NdjsonWriter
+
+
+class ParquetWriter(ProfileWriter):
+    """
+    Writes a row group every BUFFER_ROWS rows to a new file, which is only complete once closed.
+    """
+
+    def __init__(self, filename, media_stats=False):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise WriterError("--format parquet needs pyarrow, install it with: pip install pyarrow")
+
+        ProfileWriter.__init__(self, None, media_stats)
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(column, getattr(pyarrow, PARQUET_TYPES[column])()) for column in self.columns])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+        self.rows = dict((column, []) for column in self.columns)
+
+    def write_row(self, row):
+        for column in self.columns:
+            self.rows[column].append(row[column])
+
+    def flush(self):
+        if self.pending:
+            arrays = [self.pyarrow.array(self.rows[column], type=field.type) for column, field in zip(self.columns, self.schema)]
+            self.writer.write_table(self.pyarrow.Table.from_arrays(arrays, schema=self.schema))
+        self.rows = dict((column, []) for column in self.columns)
+        self.pending = 0
+    # enddef flush()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+    # enddef close()
+# endclass ParquetWriter
@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+"""
+Synthetic HLS server for testing the scripts at scale.
+
+Every playlist and segment is generated on the fly, so any number of masters,
+variants and segments can be served without files. The shape of the streams
+and the faults to inject are set by an optional first path component of
+comma separated name=value options, which the relative playlist URIs carry
+along to the variants and segments:
+
+    /master.m3u8                                  5 VOD variants of 100 segments
+    /variants=40,segments=100000/master.m3u8      40 variants of 100k segments
+    /live=1,window=6/master.m3u8                  live streams with a 6 segment sliding window
+    /latency=200,jitter=50,error=0.05/master.m3u8 slow server failing 5% of the requests
+    /rate=20000/master.m3u8                       bodies trickled at 20000 bytes/s
+    /ratelimit=10/master.m3u8                     429 for more than 10 requests/s
+    /audio=3,subtitles=2,iframes=1/master.m3u8    with alternate renditions and I-frame playlists
+    /audio=2,iframes=1,absolutemedia=1/master.m3u8
+                                                  the same with absolute rendition and I-frame URIs
+
+Options:
+    variants=N    variants per master (default 5)
+    segments=N    segments per VOD playlist (default 100)
+    duration=S    segment duration in seconds (default 6)
+    live=1        serve live playlists instead of VOD
+    window=N      segments in a live playlist (default 5)
+    missing=N     the last N variant playlists of the master return 404
+    audio=N       #EXT-X-MEDIA audio renditions (default 0)
+    subtitles=N   #EXT-X-MEDIA subtitle renditions (default 0)
+    iframes=1     an #EXT-X-I-FRAME-STREAM-INF playlist per variant
+    missingmedia=N
+                  the last N audio, subtitle and I-frame playlists return 404
+    absolutemedia=1
+                  the audio, subtitle and I-frame URIs are absolute paths
+    latency=MS    delay before every response
+    jitter=MS     random extra delay, up to this much
+    error=P       fraction of requests answered with a 500
+    rate=BPS      write the bodies at this many bytes per second
+    ratelimit=RPS answer 429 Too Many Requests (Retry-After: 1) past this many
+                  requests per second, counted per set of options
+    id=N          ignored, gives the same stream distinct URLs
+
+Anything else in the path is a 404. The playlists get an ETag so conditional
+requests are answered with a 304, and gzip is used when the client asks for it.
+
+    $ python test_server/synthetic_server.py --port 8080
+"""
+
+import argparse
+import gzip
+import hashlib
+import random
+import re
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+
+DEFAULT_OPTIONS = {
+    'variants': 5,
+    'segments': 100,
+    'duration': 6.0,
+    'live': 0,
+    'window': 5,
+    'missing': 0,
+    'audio': 0,
+    'subtitles': 0,
+    'iframes': 0,
+    'missingmedia': 0,
+    'absolutemedia': 0,
+    'latency': 0.0,
+    'jitter': 0.0,
+    'error': 0.0,
+    'rate': 0,
+    'ratelimit': 0.0,
+    'id': 0,
+}
+
+PLAYLIST_TYPE = 'application/vnd.apple.mpegurl'
+
+# v for the variants, a/s for the audio/subtitle renditions and i for the I-frame playlists
+MEDIA_PATTERN = re.compile(r'^([vasi])(\d+)/(vod|live)\.m3u8$')
+SEGMENT_PATTERN = re.compile(r'^[vasi](\d+)/seg(\d+)\.ts$')
+
+# Playlists kept ready to serve, a 100k segment playlist takes a while to generate
+MAX_CACHED_PLAYLISTS = 256
+
+WRITE_CHUNK = 4096
+
+class OptionError(ValueError):
+    pass
+# endclass OptionError
+
+
+# Splits a request path into the options and the resource it asks for
+def parse_path(path):
+    path = path.split('?', 1)[0].lstrip('/')
+    options = dict(DEFAULT_OPTIONS)
+
+    if '=' in path.split('/', 1)[0]:
+        prefix, _, path = path.partition('/')
+        for option in prefix.split(','):
+            name, _, value = option.partition('=')
+            if name not in DEFAULT_OPTIONS:
+                raise OptionError('Unknown option: %s' % name)
+            try:
+                options[name] = type(DEFAULT_OPTIONS[name])(value)
+            except ValueError:
+                raise OptionError('Invalid value for %s: %s' % (name, value))
+
+    return (options, path)
+# enddef parse_path()
+
+def get_bandwidth(variant):
+    return 250000 * (variant + 1)
+# enddef get_bandwidth()
+
+def get_resolution(variant):
+    return (128 * (variant + 1), 72 * (variant + 1))
+# enddef get_resolution()
+
+# The options part of the path of a stream, for absolute URIs to it
+def render_options(options):
+    return ','.join('%s=%s' % (name, options[name]) for name in sorted(options) if options[name] != DEFAULT_OPTIONS[name])
+# enddef render_options()
+
+def generate_master(options):
+    media = 'live.m3u8' if options['live'] else 'vod.m3u8'
+    # Rendition and I-frame URIs relative to the master, or absolute paths to the same playlists
+    prefix = '/%s/' % render_options(options) if options['absolutemedia'] else ''
+    lines = ['#EXTM3U', '#EXT-X-VERSION:4']
+    groups = ''
+    for idx in range(options['audio']):
+        lines.append('#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="Audio %d",LANGUAGE="a%d",DEFAULT=%s,AUTOSELECT=YES,URI="%sa%d/%s"'
+                     % (idx, idx, 'NO' if idx else 'YES', prefix, idx, media))
+        groups = ',AUDIO="aud"'
+    for idx in range(options['subtitles']):
+        lines.append('#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="sub",NAME="Subtitles %d",LANGUAGE="s%d",URI="%ss%d/%s"'
+                     % (idx, idx, prefix, idx, media))
+    if options['subtitles']:
+        groups += ',SUBTITLES="sub"'
+
+    for idx in range(options['variants']):
+        lines.append('#EXT-X-STREAM-INF:PROGRAM-ID=1,BANDWIDTH=%d,AVERAGE-BANDWIDTH=%d,RESOLUTION=%dx%d,CODECS="mp4a.40.2, avc1.4d401f"%s'
+                     % ((get_bandwidth(idx), get_bandwidth(idx) * 9 / 10) + get_resolution(idx) + (groups,)))
+        lines.append('v%d/%s' % (idx, media))
+
+    if options['iframes']:
+        for idx in range(options['variants']):
+            lines.append('#EXT-X-I-FRAME-STREAM-INF:BANDWIDTH=%d,RESOLUTION=%dx%d,CODECS="avc1.4d401f",URI="%si%d/%s"'
+                         % ((get_bandwidth(idx) / 10,) + get_resolution(idx) + (prefix, idx, media)))
+
+    return '\n'.join(lines) + '\n'
+# enddef generate_master()
+
+def generate_media(options, first_sequence, count, endlist):
+    duration = options['duration']
+    lines = ['#EXTM3U',
+             '#EXT-X-VERSION:3',
+             '#EXT-X-TARGETDURATION:%d' % int(duration + 0.999),
+             '#EXT-X-MEDIA-SEQUENCE:%d' % first_sequence]
+    if endlist:
+        lines.append('#EXT-X-PLAYLIST-TYPE:VOD')
+
+    extinf = '#EXTINF:%.3f,' % duration
+    for sequence in xrange(first_sequence, first_sequence + count):
+        lines.append(extinf)
+        lines.append('seg%d.ts' % sequence)
+
+    if endlist:
+        lines.append('#EXT-X-ENDLIST')
+
+    return '\n'.join(lines) + '\n'
+# enddef generate_media()
+
+# The live window slides by one segment every segment duration
+def get_live_sequence(options):
+    return int(time.time() / options['duration'])
+# enddef get_live_sequence()
+
+
+class PlaylistCache(object):
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, generate):
+        with self._lock:
+            body = self._entries.get(key)
+        if body is not None:
+            return body
+
+        body = generate()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = body
+        return body
+    # enddef get()
+# endclass PlaylistCache
+
+
+class RateLimiter(object):
+    """
+    Token buckets of a second of requests, by key.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key, rate):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (rate, now))
+            tokens = min(rate, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+
+        return allowed
+    # enddef allow()
+# endclass RateLimiter
+
+
+class SyntheticHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Send the headers and body in as few packets as possible, small unbuffered writes
+    # run into delayed ACKs and add ~40ms to every keep-alive request
+    wbufsize = WRITE_CHUNK
+    disable_nagle_algorithm = True
+    playlists = PlaylistCache(MAX_CACHED_PLAYLISTS)
+    rate_limiter = RateLimiter()
+
+    def do_HEAD(self):
+        self.handle_request(False)
+
+    def do_GET(self):
+        self.handle_request(True)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def handle_request(self, send_body):
+        try:
+            options, path = parse_path(self.path)
+        except OptionError as error:
+            self.send_body(400, 'text/plain', str(error) + '\n', send_body)
+            return
+
+        delay = options['latency'] + random.random() * options['jitter']
+        if delay:
+            time.sleep(delay / 1000.0)
+
+        if options['ratelimit'] and not self.rate_limiter.allow(tuple(sorted(options.items())), options['ratelimit']):
+            self.send_body(429, 'text/plain', 'Too many requests\n', send_body, retry_after=1)
+            return
+
+        if options['error'] and random.random() < options['error']:
+            self.send_body(500, 'text/plain', 'Injected error\n', send_body)
+            return
+
+        response = self.get_resource(options, path)
+        if response is None:
+            self.send_body(404, 'text/plain', 'Not found\n', send_body)
+            return
+
+        content_type, body = response
+        self.send_body(200, content_type, body, send_body, options['rate'])
+    # enddef handle_request()
+
+    # Returns (content type, body) for a path, or None when there's no such resource
+    def get_resource(self, options, path):
+        # The same stream under another id is the same playlist
+        key = (tuple(sorted(item for item in options.items() if item[0] != 'id')), path)
+
+        if path == 'master.m3u8':
+            return (PLAYLIST_TYPE, self.playlists.get(key, lambda: generate_master(options)))
+
+        match = MEDIA_PATTERN.match(path)
+        if match:
+            kind, idx = match.group(1), int(match.group(2))
+            if kind == 'v':
+                available = options['variants'] - options['missing']
+            else:
+                available = {'a': options['audio'],
+                             's': options['subtitles'],
+                             'i': options['variants'] if options['iframes'] else 0}[kind] - options['missingmedia']
+            if idx >= available:
+                return None
+            if match.group(3) == 'live':
+                sequence = get_live_sequence(options)
+                return (PLAYLIST_TYPE, self.playlists.get(key + (sequence,),
+                                                          lambda: generate_media(options, sequence, options['window'], False)))
+            return (PLAYLIST_TYPE, self.playlists.get(key, lambda: generate_media(options, 0, options['segments'], True)))
+
+        match = SEGMENT_PATTERN.match(path)
+        if match:
+            # Sized to average the AVERAGE-BANDWIDTH of the variant, with peaks under its BANDWIDTH
+            bitrate = get_bandwidth(int(match.group(1))) * 9 / 10 * (1.1 if int(match.group(2)) % 2 else 0.9)
+            return ('video/mp2t', '\0' * int(bitrate * options['duration'] / 8))
+
+        return None
+    # enddef get_resource()
+
+    def send_body(self, status, content_type, body, send_body, rate=0, retry_after=None):
+        etag = None
+        if content_type == PLAYLIST_TYPE:
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.getheader('if-none-match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            if 'gzip' in self.headers.getheader('accept-encoding', ''):
+                buf = StringIO()
+                gzip_file = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=1)
+                gzip_file.write(body)
+                gzip_file.close()
+                body = buf.getvalue()
+                content_type = (content_type, 'gzip')
+
+        self.send_response(status)
+        if isinstance(content_type, tuple):
+            self.send_header('Content-Type', content_type[0])
+            self.send_header('Content-Encoding', content_type[1])
+        else:
+            self.send_header('Content-Type', content_type)
+        if etag:
+            self.send_header('ETag', etag)
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if not send_body:
+            return
+
+        if not rate:
+            self.wfile.write(body)
+            return
+
+        chunk = min(WRITE_CHUNK, rate)
+        for offset in xrange(0, len(body), chunk):
+            self.wfile.write(body[offset:offset + chunk])
+            self.wfile.flush()
+            time.sleep(float(chunk) / rate)
+    # enddef send_body()
+# endclass SyntheticHandler
+
+
+class SyntheticServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, verbose=False):
+        HTTPServer.__init__(self, address, SyntheticHandler)
+        self.verbose = verbose
+# endclass SyntheticServer
+
+
+# Starts a server in a background thread, port 0 picks a free port. Returns the server.
+def start_server(host='127.0.0.1', port=0, verbose=False):
+    server = SyntheticServer((host, port), verbose)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+# enddef start_server()
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Serve generated HLS playlists and segments, with optional injected faults')
+
+    parser.add_argument('-b', '--bind',
+                        action='store',
+                        default='127.0.0.1',
+                        help='Address to listen on (default: 127.0.0.1)')
+
+    parser.add_argument('-p', '--port',
+                        action='store',
+                        type=int,
+                        default=8080,
+                        help='Port to listen on (default: 8080)')
+
+    parser.add_argument('-v', '--verbose',
+                        action='store_true',
+                        default=False,
+                        help='Log every request')
+
+    return parser.parse_args()
+# enddef get_args()
+
+def main():
+    args = get_args()
+
+    server = SyntheticServer((args.bind, args.port), args.verbose)
+    print "Serving synthetic HLS streams on http://%s:%d/master.m3u8" % server.server_address
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+# enddef main()
+
+# Start program
+if __name__ == "__main__":
+    main()